@@ -0,0 +1,83 @@
+"""
+Задержка операций FSM в разных хранилищах на сценарии регистрации:
+шесть шагов «записать поле + сменить состояние», чтение данных и
+state.clear(). Запуск из корня проекта:
+
+    python -m benchmarks.bench_fsm_storage [N] [memory,json,postgres,redis]
+"""
+import asyncio
+import statistics
+import sys
+import time
+
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+
+from config import Registration
+from fsm_storage import create_storage
+from models import engine, init_db
+
+BOT_ID = 1
+STEPS = [
+    (Registration.phone, "full_name", "Иванов Иван Иванович"),
+    (Registration.place_of_study, "phone", "+79001234567"),
+    (Registration.school, "place_of_study", "Москва"),
+    (Registration.grade, "school", "Школа 1"),
+    (Registration.email, "grade", "11 класс"),
+    (Registration.confirm, "email", "ivanov@example.com"),
+]
+
+
+async def registration_flow(storage, user_id: int, timings: list):
+    key = StorageKey(bot_id=BOT_ID, chat_id=user_id, user_id=user_id)
+    state = FSMContext(storage=storage, key=key)
+
+    async def timed(op):
+        started = time.perf_counter()
+        await op
+        timings.append(time.perf_counter() - started)
+
+    await timed(state.set_state(Registration.full_name))
+    for next_state, field, value in STEPS:
+        await timed(state.update_data(**{field: value}))
+        await timed(state.set_state(next_state))
+    await timed(state.get_data())
+    await timed(state.clear())
+
+
+async def bench(kind: str, n: int):
+    # Без сброса по TTL: сравниваются сами хранилища, без ExpiringStorage.
+    storage = create_storage(kind, ttl=0)
+    timings = []
+    started = time.perf_counter()
+    # Одновременно идут регистрации разных участников.
+    await asyncio.gather(*(registration_flow(storage, 10**9 + i, timings) for i in range(n)))
+    total = time.perf_counter() - started
+    await storage.close()
+
+    timings.sort()
+    p95 = timings[int(len(timings) * 0.95)]
+    print(
+        f"{kind:9} {len(timings):6} оп.  "
+        f"медиана {statistics.median(timings) * 1000:7.3f} мс  "
+        f"p95 {p95 * 1000:7.3f} мс  "
+        f"{len(timings) / total:9.0f} оп/с"
+    )
+
+
+async def main(n: int, kinds: list):
+    if "postgres" in kinds:
+        await init_db()
+    for kind in kinds:
+        try:
+            await bench(kind, n)
+        except Exception as e:
+            print(f"{kind:9} пропущено: {e}")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 200,
+        sys.argv[2].split(",") if len(sys.argv) > 2 else ["memory", "json", "postgres", "redis"],
+    ))
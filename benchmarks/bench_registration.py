@@ -0,0 +1,105 @@
+"""
+Регистраций в секунду: старый путь (INSERT, flush, UPDATE кредов, commit)
+против одного INSERT ... RETURNING из insert_registration.
+
+Таблица создается в отдельной схеме bench_registration вместе с триггерами
+из USERS_BOT_TRIGGERS (ревизия для выгрузок, NOTIFY ролей), как в рабочей
+БД, и удаляется после замера. Запуск из корня проекта:
+
+    python -m benchmarks.bench_registration [N] [CONCURRENCY]
+"""
+import asyncio
+import sys
+import time
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from handlers.registration import generate_password
+from models import (
+    USERS_BOT_TRIGGERS,
+    Base,
+    User,
+    UsersRevision,
+    async_session,
+    creds_fingerprint,
+    engine,
+    insert_registration,
+)
+
+SCHEMA = "bench_registration"
+
+
+def fields(telegram_id: int) -> dict:
+    return {
+        "telegram_id": telegram_id,
+        "username": f"bench_{telegram_id}",
+        "full_name": "Иванов Иван Иванович",
+        "phone": "+79001234567",
+        "place_of_study": "Москва",
+        "school": "Школа 1",
+        "grade": "11 класс",
+        "email": f"bench_{telegram_id}@example.com",
+    }
+
+
+async def register_orm(session: AsyncSession, telegram_id: int):
+    """Регистрация как до insert_registration."""
+
+    new_user = User(**fields(telegram_id))
+    session.add(new_user)
+    await session.flush()
+    login, pwd = f"user{new_user.id}", generate_password()
+    new_user.login_id = login
+    new_user.plain_password = pwd
+    new_user.creds_sent_hash = creds_fingerprint(login, pwd)
+    await session.commit()
+
+
+async def register_single(session: AsyncSession, telegram_id: int):
+    await session.execute(insert_registration(generate_password(), **fields(telegram_id)))
+    await session.commit()
+
+
+async def measure(register, first_id: int, n: int, concurrency: int) -> float:
+    ids = iter(range(first_id, first_id + n))
+
+    async def worker():
+        for telegram_id in ids:
+            async with async_session() as session:
+                await session.execute(text(f"SET LOCAL search_path TO {SCHEMA}"))
+                await register(session, telegram_id)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return n / (time.perf_counter() - started)
+
+
+async def main(n: int, concurrency: int):
+    async with engine.begin() as conn:
+        await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        await conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        await conn.execute(text(f"SET LOCAL search_path TO {SCHEMA}"))
+        await conn.run_sync(
+            Base.metadata.create_all, tables=[User.__table__, UsersRevision.__table__]
+        )
+        for patch in USERS_BOT_TRIGGERS:
+            await conn.execute(text(patch))
+
+    try:
+        before = await measure(register_orm, 1, n, concurrency)
+        after = await measure(register_single, n + 1, n, concurrency)
+        print(f"{n} регистраций, {concurrency} одновременно")
+        print(f"INSERT + flush + UPDATE: {before:8.1f} рег/с")
+        print(f"INSERT ... RETURNING:    {after:8.1f} рег/с  (x{after / before:.2f})")
+    finally:
+        async with engine.begin() as conn:
+            await conn.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 2000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 8,
+    ))
@@ -0,0 +1,117 @@
+"""
+Планы запросов к users_bot на синтетической таблице.
+
+Создает схему bench_users, заполняет ее N участниками и для каждого
+пути поиска печатает узлы плана и время выполнения: сначала без
+индексов из INDEXES, затем с ними. Запуск из корня проекта:
+
+    python -m benchmarks.bench_user_indexes [N]
+"""
+import asyncio
+import json
+import sys
+
+from sqlalchemy import select, text
+
+from exporter import EXPORT_COLUMNS
+from models import Base, User, engine, username_is
+
+SCHEMA = "bench_users"
+
+INDEXES = (
+    "ix_users_bot_username_lower",
+    "ix_users_bot_banned",
+    "ix_users_bot_admin",
+    "ix_users_bot_points_name",
+)
+
+FILL = """
+INSERT INTO users_bot (
+    telegram_id, username, full_name, phone, place_of_study, school, grade,
+    email, points, login_id, plain_password, is_banned, is_admin
+)
+SELECT
+    1000000 + g,
+    CASE WHEN g % 10 = 0 THEN NULL ELSE 'User_' || g END,
+    'Участник ' || g,
+    '+7900' || g,
+    'Город ' || (g % 300),
+    'Школа ' || (g % 5000),
+    (g % 11 + 1) || ' класс',
+    'u' || g || '@example.com',
+    (random() * 100)::int,
+    'user' || g,
+    md5(g::text),
+    g % 1000 = 0,
+    g % 20000 = 0
+FROM generate_series(1, :n) AS g
+"""
+
+
+def cases(n: int) -> dict:
+    return {
+        # Каждый десятый username в FILL — NULL: берем существующий.
+        "username": select(User).where(username_is(f"user_{n // 2 + 1}")),
+        "banned": select(User.telegram_id).where(User.is_banned.is_(True)),
+        "admins": select(User.telegram_id).where(User.is_admin.is_(True)),
+        # Первая пачка серверного курсора выгрузки.
+        "export": select(*EXPORT_COLUMNS)
+        .order_by(User.points.desc(), User.full_name, User.id)
+        .limit(1000),
+    }
+
+
+def plan_nodes(plan: dict) -> list[str]:
+    node = plan["Node Type"]
+    if "Index Name" in plan:
+        node += f" ({plan['Index Name']})"
+    nodes = [node]
+    for child in plan.get("Plans", []):
+        nodes.extend(plan_nodes(child))
+    return nodes
+
+
+async def explain(conn, stmt) -> tuple[list[str], float]:
+    sql = stmt.compile(
+        dialect=conn.dialect, compile_kwargs={"literal_binds": True}
+    )
+    result = await conn.exec_driver_sql(f"EXPLAIN (ANALYZE, FORMAT JSON) {sql}")
+    report = result.scalar()
+    if isinstance(report, str):
+        report = json.loads(report)
+    return plan_nodes(report[0]["Plan"]), report[0]["Execution Time"]
+
+
+async def run_cases(conn, n: int, title: str):
+    print(f"\n== {title}")
+    for name, stmt in cases(n).items():
+        nodes, ms = await explain(conn, stmt)
+        print(f"{name:10} {ms:9.2f} ms  {' -> '.join(nodes)}")
+
+
+async def main(n: int):
+    async with engine.begin() as conn:
+        await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        await conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        await conn.execute(text(f"SET LOCAL search_path TO {SCHEMA}"))
+        await conn.run_sync(Base.metadata.create_all, tables=[User.__table__])
+
+        for name in INDEXES:
+            await conn.execute(text(f"DROP INDEX {name}"))
+        await conn.execute(text(FILL), {"n": n})
+        await conn.execute(text("ANALYZE users_bot"))
+        await run_cases(conn, n, f"{n} участников, без индексов")
+
+        for index in User.__table__.indexes:
+            if index.name in INDEXES:
+                await conn.run_sync(index.create)
+        await conn.execute(text("ANALYZE users_bot"))
+        await run_cases(conn, n, f"{n} участников, с индексами")
+
+        await conn.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000))
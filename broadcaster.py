@@ -0,0 +1,497 @@
+"""Движок массовых рассылок."""
+import asyncio
+import time
+from typing import (
+    Any,
+    AsyncIterable,
+    Awaitable,
+    Callable,
+    Iterable,
+    Optional,
+    Union,
+)
+
+from aiogram.methods import CopyMessage, SendMediaGroup, TelegramMethod
+from aiogram.types import MessageEntity
+from aiogram.utils.media_group import MediaGroupBuilder
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import (
+    BROADCAST_BATCH_SIZE,
+    BROADCAST_PROGRESS_INTERVAL,
+    SEND_CONCURRENCY,
+    bot,
+    unreachable_ids,
+)
+from keyboards import get_broadcast_control_kb
+from models import (
+    BroadcastDelivery,
+    BroadcastJob,
+    User,
+    async_session,
+    iter_user_batches,
+    segment_where,
+)
+from sender import DeliveryFailed, scheduler
+
+
+async def run_broadcast(
+    recipients: Union[Iterable[Any], AsyncIterable[Any]],
+    send: Callable[[Any], Awaitable[Any]],
+    on_result: Optional[
+        Callable[[Any, Optional[DeliveryFailed]], Awaitable[Any]]
+    ] = None,
+    cost: int = 1,
+    window: int = SEND_CONCURRENCY * 4,
+) -> tuple[int, int]:
+    """
+    Отправляет send(row) получателям через общий планировщик.
+    recipients — строки с полем telegram_id, обычный или асинхронный
+    итератор: отправка начинается с первой строки, не дожидаясь остальных,
+    а в работе одновременно не больше window сообщений. Недоступные
+    получатели помечаются в БД и в следующих рассылках пропускаются.
+    Возвращает (отправлено, ошибок).
+    """
+
+    slots = asyncio.Semaphore(window)
+    tasks: set[asyncio.Task] = set()
+    unreachable: list = []
+    sent = 0
+    failed = 0
+
+    async def deliver(row):
+        nonlocal sent, failed
+        error = None
+        try:
+            await scheduler.send(row.telegram_id, lambda: send(row), cost)
+            sent += 1
+        except DeliveryFailed as e:
+            error = e
+            failed += 1
+            if e.unreachable:
+                unreachable.append(row)
+        finally:
+            slots.release()
+        if on_result:
+            await on_result(row, error)
+
+    async def submit(row):
+        await slots.acquire()
+        task = asyncio.create_task(deliver(row))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    try:
+        if hasattr(recipients, "__aiter__"):
+            async for row in recipients:
+                await submit(row)
+        else:
+            for row in recipients:
+                await submit(row)
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        if unreachable:
+            await mark_unreachable(unreachable)
+
+    return sent, failed
+
+
+async def mark_unreachable(rows):
+    """Помечает участников, которым доставка невозможна."""
+
+    try:
+        async with async_session() as session:
+            await session.execute(
+                update(User)
+                .where(User.id.in_([row.id for row in rows]))
+                .values(is_unreachable=True)
+            )
+            await session.commit()
+    except Exception as e:
+        print(f"Не удалось пометить недоступных участников: {e}")
+        return
+
+    unreachable_ids.update(row.telegram_id for row in rows)
+
+
+class DeliveryLog:
+    """Пишет статусы доставки в БД пачками через одно соединение."""
+
+    MAX_CHUNK = 200
+
+    def __init__(self, job_id: int):
+        self.job_id = job_id
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._writer())
+
+    async def add(self, row, error: Optional[DeliveryFailed]):
+        await self.queue.put({
+            "job_id": self.job_id,
+            "user_id": row.id,
+            "status": "failed" if error else "sent",
+        })
+
+    async def flush(self):
+        """Дожидается записи всех статусов."""
+
+        await self.queue.join()
+
+    async def close(self):
+        await self.flush()
+        self._task.cancel()
+
+    async def _writer(self):
+        while True:
+            rows = [await self.queue.get()]
+            while not self.queue.empty() and len(rows) < self.MAX_CHUNK:
+                rows.append(self.queue.get_nowait())
+            try:
+                async with async_session() as session:
+                    await session.execute(
+                        insert(BroadcastDelivery).values(rows).on_conflict_do_nothing()
+                    )
+                    await session.commit()
+            except Exception as e:
+                print(f"Broadcast {self.job_id}: не удалось записать статусы: {e}")
+            finally:
+                for _ in rows:
+                    self.queue.task_done()
+
+
+def dump_entities(entities):
+    """MessageEntity -> JSON для хранения в задании."""
+
+    if not entities:
+        return None
+    return [entity.model_dump(exclude_none=True) for entity in entities]
+
+
+class PreparedPayload:
+    """
+    Готовый запрос к Bot API, собранный один раз на всю рассылку.
+    Для каждого получателя делается только поверхностная копия с его chat_id.
+    """
+
+    __slots__ = ("method", "cost")
+
+    def __init__(self, method: TelegramMethod, cost: int = 1):
+        self.method = method
+        self.cost = cost
+
+    async def send(self, row):
+        return await bot(self.method.model_copy(update={"chat_id": row.telegram_id}))
+
+
+def prepare_payload(job: BroadcastJob) -> PreparedPayload:
+    """Собирает содержимое задания в готовый запрос."""
+
+    if not job.album:
+        return PreparedPayload(CopyMessage(
+            chat_id=job.admin_id,
+            from_chat_id=job.from_chat_id,
+            message_id=job.message_id,
+        ))
+
+    mb = MediaGroupBuilder()
+    for m_type, m_id, m_cap, m_ents in job.album:
+        m_ents = [MessageEntity(**e) for e in m_ents] if m_ents else None
+        if m_type == 'photo':
+            mb.add_photo(m_id, caption=m_cap, caption_entities=m_ents)
+        elif m_type == 'video':
+            mb.add_video(m_id, caption=m_cap, caption_entities=m_ents)
+        elif m_type == 'document':
+            mb.add_document(m_id, caption=m_cap, caption_entities=m_ents)
+        elif m_type == 'audio':
+            mb.add_audio(m_id, caption=m_cap, caption_entities=m_ents)
+
+    media = mb.build()
+    return PreparedPayload(
+        SendMediaGroup(chat_id=job.admin_id, media=media), cost=len(media)
+    )
+
+
+async def create_job(
+    session: AsyncSession,
+    admin_id: int,
+    from_chat_id: int,
+    message_id: int,
+    album: list = None,
+    total: int = 0,
+    progress_message_id: int = None,
+    segment_field: str = None,
+    segment_value: str = None,
+) -> int:
+    """Сохраняет задание на рассылку в сессии обработчика и возвращает его id."""
+
+    job = BroadcastJob(
+        admin_id=admin_id,
+        from_chat_id=from_chat_id,
+        message_id=message_id,
+        album=album,
+        total=total,
+        progress_message_id=progress_message_id,
+        segment_field=segment_field,
+        segment_value=segment_value,
+    )
+    session.add(job)
+    await session.commit()
+    return job.id
+
+
+async def set_job_status(job_id: int, status: str):
+    async with async_session() as session:
+        await session.execute(
+            update(BroadcastJob).where(BroadcastJob.id == job_id).values(status=status)
+        )
+        await session.commit()
+
+
+async def count_deliveries(job_id: int) -> dict[str, int]:
+    async with async_session() as session:
+        result = await session.execute(
+            select(BroadcastDelivery.status, func.count())
+            .where(BroadcastDelivery.job_id == job_id)
+            .group_by(BroadcastDelivery.status)
+        )
+        return dict(result.all())
+
+
+class BroadcastRun:
+    """Рассылка, выполняемая в фоне этим процессом: счетчики и управление."""
+
+    def __init__(self, job: BroadcastJob, counts: dict[str, int]):
+        self.job_id = job.id
+        self.admin_id = job.admin_id
+        self.progress_message_id = job.progress_message_id
+        self.total = job.total
+        self.sent = counts.get("sent", 0)
+        self.failed = counts.get("failed", 0)
+        self.cancelled = False
+        self.running = asyncio.Event()
+        self.running.set()
+        self.task: asyncio.Task = None
+        self._started = time.monotonic()
+        self._done_at_start = self.sent + self.failed
+
+    @property
+    def paused(self) -> bool:
+        return not self.running.is_set()
+
+    @property
+    def remaining(self) -> int:
+        return max(self.total - self.sent - self.failed, 0)
+
+    def eta(self) -> Optional[float]:
+        """Оценка оставшегося времени по скорости текущего запуска."""
+
+        done = self.sent + self.failed - self._done_at_start
+        elapsed = time.monotonic() - self._started
+        if done <= 0 or elapsed <= 0:
+            return None
+        return self.remaining / (done / elapsed)
+
+    def pause(self):
+        self.running.clear()
+
+    def resume(self):
+        self.running.set()
+
+    def cancel(self):
+        self.cancelled = True
+        self.running.set()
+
+    async def on_result(self, row, error: Optional[DeliveryFailed]):
+        if error:
+            self.failed += 1
+        else:
+            self.sent += 1
+
+    async def gate(self, rows):
+        """Отдает получателей, пока рассылка не на паузе и не отменена."""
+
+        for row in rows:
+            await self.running.wait()
+            if self.cancelled:
+                return
+            yield row
+
+    def progress_text(self, final: bool = False) -> str:
+        if final:
+            title = "🚫 Рассылка отменена" if self.cancelled else "✅ Рассылка завершена"
+        elif self.paused:
+            title = "⏸ Рассылка на паузе"
+        else:
+            title = "⏳ Идет рассылка"
+
+        text = (
+            f"{title} #{self.job_id}\n"
+            f"Отправлено: {self.sent}\n"
+            f"Ошибок: {self.failed}\n"
+            f"Осталось: {self.remaining}"
+        )
+        eta = self.eta()
+        if not final and not self.paused and eta is not None:
+            minutes, seconds = divmod(int(eta), 60)
+            text += f"\nОсталось времени: ~{minutes} мин {seconds:02d} сек"
+        return text
+
+    async def show_progress(self, final: bool = False):
+        """Обновляет сообщение с прогрессом у админа."""
+
+        if not self.progress_message_id:
+            return
+        markup = None if final else get_broadcast_control_kb(self.job_id, self.paused)
+        try:
+            await scheduler.send(self.admin_id, lambda: bot.edit_message_text(
+                chat_id=self.admin_id,
+                message_id=self.progress_message_id,
+                text=self.progress_text(final),
+                reply_markup=markup,
+            ))
+        except DeliveryFailed:
+            pass
+
+    async def report_progress(self):
+        """Не чаще раза в BROADCAST_PROGRESS_INTERVAL правит сообщение прогресса."""
+
+        last = None
+        while True:
+            await asyncio.sleep(BROADCAST_PROGRESS_INTERVAL)
+            state = (self.sent, self.failed, self.paused)
+            if state != last:
+                last = state
+                await self.show_progress()
+
+
+_runs: dict[int, BroadcastRun] = {}
+
+
+def get_run(job_id: int) -> Optional[BroadcastRun]:
+    return _runs.get(job_id)
+
+
+async def run_job(run: BroadcastRun, job: BroadcastJob):
+    """
+    Выполняет задание с места остановки: курсор сохраняется после каждой
+    пачки, а уже записанные доставки внутри пачки пропускаются.
+    """
+
+    job_id = job.id
+    payload = prepare_payload(job)
+    cursor = job.cursor
+    log = DeliveryLog(job_id)
+
+    async def on_result(row, error):
+        await run.on_result(row, error)
+        await log.add(row, error)
+
+    where = (~User.is_unreachable, *segment_where(job.segment_field, job.segment_value))
+
+    reporter = asyncio.create_task(run.report_progress())
+    try:
+        batches = iter_user_batches(
+            User.telegram_id,
+            after_id=cursor,
+            batch_size=BROADCAST_BATCH_SIZE,
+            where=where,
+        )
+        async for rows in batches:
+            async with async_session() as session:
+                done = set((await session.execute(
+                    select(BroadcastDelivery.user_id).where(
+                        BroadcastDelivery.job_id == job_id,
+                        BroadcastDelivery.user_id > cursor,
+                        BroadcastDelivery.user_id <= rows[-1].id,
+                    )
+                )).scalars())
+
+            pending = [row for row in rows if row.id not in done]
+            await run_broadcast(
+                run.gate(pending), payload.send, on_result=on_result, cost=payload.cost
+            )
+            await log.flush()
+            if run.cancelled:
+                break
+
+            cursor = rows[-1].id
+            async with async_session() as session:
+                await session.execute(
+                    update(BroadcastJob)
+                    .where(BroadcastJob.id == job_id)
+                    .values(cursor=cursor)
+                )
+                await session.commit()
+    finally:
+        reporter.cancel()
+        await log.close()
+
+    counts = await count_deliveries(job_id)
+    async with async_session() as session:
+        await session.execute(
+            update(BroadcastJob)
+            .where(BroadcastJob.id == job_id)
+            .values(
+                status="cancelled" if run.cancelled else "done",
+                sent_count=counts.get("sent", 0),
+                failed_count=counts.get("failed", 0),
+                finished_at=func.now(),
+            )
+        )
+        await session.commit()
+
+    await run.show_progress(final=True)
+    try:
+        await scheduler.send(run.admin_id, lambda: bot.send_message(
+            run.admin_id, run.progress_text(final=True)
+        ))
+    except DeliveryFailed:
+        pass
+
+
+async def start_job(job_id: int) -> Optional[BroadcastRun]:
+    """Запускает задание в фоне, если оно еще не выполняется в этом процессе."""
+
+    run = _runs.get(job_id)
+    if run:
+        return run
+
+    async with async_session() as session:
+        job = await session.get(BroadcastJob, job_id)
+    if job is None or job.status in ("done", "cancelled"):
+        return None
+
+    run = BroadcastRun(job, await count_deliveries(job_id))
+    if job.status == "paused":
+        run.pause()
+    _runs[job_id] = run
+
+    async def runner():
+        try:
+            await run_job(run, job)
+        except Exception as e:
+            print(f"Broadcast {job_id}: ошибка: {e}")
+        finally:
+            _runs.pop(job_id, None)
+
+    run.task = asyncio.create_task(runner())
+    return run
+
+
+async def resume_jobs():
+    """Продолжает рассылки, прерванные перезапуском бота."""
+
+    async with async_session() as session:
+        result = await session.execute(
+            select(BroadcastJob.id).where(BroadcastJob.status == "running")
+        )
+        job_ids = result.scalars().all()
+
+    for job_id in job_ids:
+        await start_job(job_id)
+
+    if job_ids:
+        print(f"Возобновлено рассылок: {len(job_ids)}")
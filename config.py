@@ -17,6 +17,53 @@ architect_id_str = os.getenv("ARCHITECT_ID", "")
 ARCHITECT_ID = int(architect_id_str) if architect_id_str else 0
 
 DATABASE_URL = os.getenv("DATABASE_URL")
+# Прямое подключение к PostgreSQL в обход PgBouncer (для LISTEN).
+DATABASE_DIRECT_URL = os.getenv("DATABASE_DIRECT_URL") or None
+
+# Пул соединений. Рассылка, выгрузка и регистрация работают одновременно,
+# поэтому размер пула вынесен в окружение.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+# PgBouncer в режиме transaction: без кэша prepared statements и без LISTEN.
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "0") == "1"
+
+# Лимиты Telegram: ~30 сообщений/сек на бота и ~1 сообщение/сек в один чат.
+# Запас до 30 оставлен под обычные ответы бота во время рассылки.
+SEND_RATE = float(os.getenv("SEND_RATE", "25"))
+SEND_PER_CHAT_INTERVAL = float(os.getenv("SEND_PER_CHAT_INTERVAL", "1"))
+SEND_CONCURRENCY = int(os.getenv("SEND_CONCURRENCY", "16"))
+SEND_MAX_ATTEMPTS = int(os.getenv("SEND_MAX_ATTEMPTS", "5"))
+SEND_BACKOFF = float(os.getenv("SEND_BACKOFF", "1"))
+BROADCAST_BATCH_SIZE = int(os.getenv("BROADCAST_BATCH_SIZE", "500"))
+BROADCAST_PROGRESS_INTERVAL = float(os.getenv("BROADCAST_PROGRESS_INTERVAL", "5"))
+
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "10000"))
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", "300"))
+PROFILE_CACHE_NEGATIVE_TTL = float(os.getenv("PROFILE_CACHE_NEGATIVE_TTL", "30"))
+
+# Хранилище FSM: memory, json (локальная замена с JSON как у внешних),
+# postgres или redis (нужен пакет redis и REDIS_URL).
+FSM_STORAGE = os.getenv("FSM_STORAGE", "memory")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# Брошенные сценарии (регистрация, жалоба и т.п.) сбрасываются после
+# FSM_SESSION_TTL секунд без изменений; 0 — не сбрасывать.
+FSM_SESSION_TTL = float(os.getenv("FSM_SESSION_TTL", "3600"))
+FSM_SWEEP_INTERVAL = float(os.getenv("FSM_SWEEP_INTERVAL", "60"))
+FSM_EXPIRE_NOTIFY = os.getenv("FSM_EXPIRE_NOTIFY", "1") == "1"
+# Реестр диалогов с организаторами: memory или postgres (общий для
+# нескольких процессов бота).
+DIALOG_STORAGE = os.getenv("DIALOG_STORAGE", "memory")
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+EXPORT_QUEUE_SIZE = int(os.getenv("EXPORT_QUEUE_SIZE", "4"))
+# Telegram принимает от бота файлы до 50 МБ; размер части проверяется
+# с опозданием на очередь пачек, поэтому порог с запасом.
+EXPORT_PART_ROWS = int(os.getenv("EXPORT_PART_ROWS", "100000"))
+EXPORT_PART_BYTES = int(os.getenv("EXPORT_PART_BYTES", str(40 * 1024 * 1024)))
 
 logging.basicConfig(level=logging.INFO)
 
@@ -24,9 +71,9 @@ bot = Bot(token=API_TOKEN)
 dp = Dispatcher(storage=MemoryStorage())
 
 active_alerts: dict[int, list[list[tuple[int, int]]]] = {}
-active_dialogs: dict[int, int] = {}
 
 banned_ids: set[int] = set()
+unreachable_ids: set[int] = set()
 
 admin_ids_set: set[int] = set(ENV_ADMIN_IDS)
 if ARCHITECT_ID:
@@ -67,6 +114,8 @@ class Support(StatesGroup):
 class AdminPanel(StatesGroup):
     """Состояния для админ панели."""
 
+    choosing_broadcast_segment = State()
+    waiting_for_segment_value = State()
     waiting_for_broadcast_content = State()
     waiting_for_user_search = State()
     waiting_for_user_id = State()
@@ -0,0 +1,166 @@
+"""Реестр диалогов организаторов с участниками."""
+from typing import List, Optional, Tuple
+
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from sqlalchemy import delete, func, or_, select
+from sqlalchemy.exc import IntegrityError
+
+from config import DIALOG_STORAGE, bot, dp
+from models import ActiveDialog, async_session
+
+# (user_id, admin_id) завершенного диалога
+Pair = Tuple[int, int]
+
+# Ключ pg_advisory_xact_lock, под которым идут все start.
+DIALOGS_LOCK_ID = 0x6469616C
+START_ATTEMPTS = 3
+
+
+class LocalDialogStore:
+    """
+    Два словаря: участник -> организатор и организатор -> участник.
+    У участника не больше одного организатора, у организатора — не больше
+    одного участника; start и stop меняют оба словаря без await.
+    """
+
+    def __init__(self):
+        self.admin_by_user: dict[int, int] = {}
+        self.user_by_admin: dict[int, int] = {}
+
+    def _drop(self, user_id: int) -> Optional[int]:
+        admin_id = self.admin_by_user.pop(user_id, None)
+        if admin_id is not None and self.user_by_admin.get(admin_id) == user_id:
+            del self.user_by_admin[admin_id]
+        return admin_id
+
+    async def start(self, user_id: int, admin_id: int) -> List[Pair]:
+        """Связывает участника с организатором; возвращает вытесненные диалоги."""
+
+        ended = []
+        previous_admin = self.admin_by_user.get(user_id)
+        if previous_admin is not None and previous_admin != admin_id:
+            self._drop(user_id)
+            ended.append((user_id, previous_admin))
+        previous_user = self.user_by_admin.get(admin_id)
+        if previous_user is not None and previous_user != user_id:
+            self._drop(previous_user)
+            ended.append((previous_user, admin_id))
+        self.admin_by_user[user_id] = admin_id
+        self.user_by_admin[admin_id] = user_id
+        return ended
+
+    async def stop(self, user_id: int, admin_id: int = None) -> Optional[int]:
+        """
+        Завершает диалог участника и возвращает id организатора.
+        С admin_id — только если участник говорит именно с ним.
+        """
+
+        if admin_id is not None and self.admin_by_user.get(user_id) != admin_id:
+            return None
+        return self._drop(user_id)
+
+    async def admin_of(self, user_id: int) -> Optional[int]:
+        return self.admin_by_user.get(user_id)
+
+    async def user_of(self, admin_id: int) -> Optional[int]:
+        return self.user_by_admin.get(admin_id)
+
+
+class PgDialogStore:
+    """
+    Диалоги в таблице active_dialogs: их видят все процессы бота.
+    Поиск в обе стороны — по первичному ключу и уникальному admin_id; они же
+    не дают участнику двух организаторов, а организатору — двух участников.
+    start и stop идут одной транзакцией, start — еще и под advisory lock.
+    """
+
+    async def start(self, user_id: int, admin_id: int) -> List[Pair]:
+        """Связывает участника с организатором; возвращает вытесненные диалоги."""
+
+        for attempt in range(START_ATTEMPTS):
+            try:
+                return await self._start(user_id, admin_id)
+            except IntegrityError:
+                if attempt == START_ATTEMPTS - 1:
+                    raise
+
+    async def _start(self, user_id: int, admin_id: int) -> List[Pair]:
+        async with async_session() as session:
+            # Строк для FOR UPDATE может еще не быть, поэтому start во всех
+            # процессах идут по очереди под advisory lock до конца транзакции.
+            await session.execute(select(func.pg_advisory_xact_lock(DIALOGS_LOCK_ID)))
+            result = await session.execute(
+                delete(ActiveDialog)
+                .where(
+                    or_(
+                        ActiveDialog.user_id == user_id,
+                        ActiveDialog.admin_id == admin_id,
+                    )
+                )
+                .returning(ActiveDialog.user_id, ActiveDialog.admin_id)
+            )
+            ended = [tuple(row) for row in result.all()]
+            session.add(ActiveDialog(user_id=user_id, admin_id=admin_id))
+            await session.commit()
+        return [pair for pair in ended if pair != (user_id, admin_id)]
+
+    async def stop(self, user_id: int, admin_id: int = None) -> Optional[int]:
+        """
+        Завершает диалог участника и возвращает id организатора.
+        С admin_id — только если участник говорит именно с ним.
+        """
+
+        stmt = delete(ActiveDialog).where(ActiveDialog.user_id == user_id)
+        if admin_id is not None:
+            stmt = stmt.where(ActiveDialog.admin_id == admin_id)
+        async with async_session() as session:
+            result = await session.execute(stmt.returning(ActiveDialog.admin_id))
+            await session.commit()
+        return result.scalar()
+
+    async def admin_of(self, user_id: int) -> Optional[int]:
+        async with async_session() as session:
+            return await session.scalar(
+                select(ActiveDialog.admin_id).where(ActiveDialog.user_id == user_id)
+            )
+
+    async def user_of(self, admin_id: int) -> Optional[int]:
+        async with async_session() as session:
+            return await session.scalar(
+                select(ActiveDialog.user_id).where(ActiveDialog.admin_id == admin_id)
+            )
+
+
+def create_dialog_store(kind: str = DIALOG_STORAGE):
+    if kind == "memory":
+        return LocalDialogStore()
+    if kind == "postgres":
+        return PgDialogStore()
+    raise ValueError(f"Неизвестное хранилище диалогов: {kind}")
+
+
+dialogs = create_dialog_store()
+
+
+async def release_orphans(ended: List[Pair], user_id: int, admin_id: int):
+    """Сообщает участникам и организаторам, чьи диалоги вытеснил новый."""
+
+    for old_user_id, old_admin_id in ended:
+        if old_user_id != user_id:
+            user_key = StorageKey(
+                bot_id=bot.id, chat_id=old_user_id, user_id=old_user_id
+            )
+            await FSMContext(storage=dp.storage, key=user_key).clear()
+            chat_id = old_user_id
+            text = "🔕 <b>Диалог с организатором завершен.</b>"
+        elif old_admin_id != admin_id:
+            chat_id = old_admin_id
+            text = f"🔕 <b>Участника (ID {old_user_id}) забрал другой организатор.</b>"
+        else:
+            continue
+
+        try:
+            await bot.send_message(chat_id, text, parse_mode="HTML")
+        except Exception as e:
+            print(f"Не удалось сообщить о завершении диалога {chat_id}: {e}")
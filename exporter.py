@@ -0,0 +1,391 @@
+"""Выгрузка результатов участников."""
+import asyncio
+import csv
+import gzip
+import io
+import json
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import openpyxl
+from aiogram.types import BufferedInputFile
+from openpyxl.utils import get_column_letter
+from sqlalchemy import and_, or_, select, tuple_
+
+from config import (
+    EXPORT_BATCH_SIZE,
+    EXPORT_PART_BYTES,
+    EXPORT_PART_ROWS,
+    EXPORT_QUEUE_SIZE,
+)
+from models import User, async_session, users_version
+
+
+EXPORT_HEADERS = [
+    "ID в БД",
+    "Telegram ID",
+    "Username",
+    "ФИО",
+    "Очки (Points)",
+    "Телефон",
+    "Населенный пункт",
+    "Учебное заведение",
+    "Класс/Курс",
+    "Email",
+    "Логин",
+    "Пароль",
+    "Статус бана"
+]
+
+EXPORT_COLUMNS = (
+    User.id,
+    User.telegram_id,
+    User.username,
+    User.full_name,
+    User.points,
+    User.phone,
+    User.place_of_study,
+    User.school,
+    User.grade,
+    User.email,
+    User.login_id,
+    User.plain_password,
+    User.is_banned,
+)
+
+
+EXPORT_FIELDS = [column.key for column in EXPORT_COLUMNS]
+
+
+def export_row(row) -> list:
+    """Строка БД -> строка таблицы."""
+
+    return [
+        row.id,
+        row.telegram_id,
+        f"@{row.username}" if row.username else "Нет",
+        row.full_name,
+        row.points,
+        row.phone,
+        row.place_of_study,
+        row.school,
+        row.grade,
+        row.email,
+        row.login_id,
+        row.plain_password,
+        "ЗАБАНЕН" if row.is_banned else "-"
+    ]
+
+
+def _after(row):
+    """Строки после row в порядке (points DESC, full_name, id); NULL в points — первыми."""
+
+    rest = tuple_(User.full_name, User.id) > (row.full_name, row.id)
+    if row.points is None:
+        return or_(User.points.is_not(None), and_(User.points.is_(None), rest))
+    return or_(User.points < row.points, and_(User.points == row.points, rest))
+
+
+async def iter_export_batches():
+    """
+    Строки для выгрузки пачками. Как iter_user_batches: каждая пачка —
+    отдельный короткий запрос по ключу (points, full_name, id), так что
+    соединение не держится, пока части выгрузки загружаются в Telegram.
+    """
+
+    last = None
+    while True:
+        stmt = (
+            select(*EXPORT_COLUMNS)
+            .order_by(User.points.desc(), User.full_name, User.id)
+            .limit(EXPORT_BATCH_SIZE)
+        )
+        if last is not None:
+            stmt = stmt.where(_after(last))
+        async with async_session() as session:
+            rows = (await session.execute(stmt)).all()
+
+        if not rows:
+            return
+        yield rows
+        last = rows[-1]
+
+
+class XlsxExport:
+    """
+    Книга write-only. append_rows возвращает текущий размер файла в байтах.
+    Методы вызываются только из потока _export_pool,
+    чтобы построение таблицы не блокировало event loop.
+    """
+
+    def __init__(self):
+        self.wb = openpyxl.Workbook(write_only=True)
+        self.ws = self.wb.create_sheet("Результаты")
+        for col_num in range(1, len(EXPORT_HEADERS) + 1):
+            self.ws.column_dimensions[get_column_letter(col_num)].width = 20
+        self.ws.append(EXPORT_HEADERS)
+
+    def append_rows(self, rows) -> int:
+        for row in rows:
+            self.ws.append(export_row(row))
+        # Несжатый XML листа во временном файле: книга в zip будет меньше,
+        # так что это оценка сверху. Публичного доступа к этому файлу
+        # у openpyxl нет, путь берется из write-only листа (openpyxl 3.1).
+        return os.path.getsize(self.ws._writer.out)
+
+    def finish(self) -> bytes:
+        buffer = io.BytesIO()
+        self.wb.save(buffer)
+        return buffer.getvalue()
+
+    def close(self):
+        """Удаляет временный файл листа, если книга так и не сохранена."""
+
+        if self.ws.closed or self.ws._writer is None:
+            return
+        if self.ws._rows is not None:
+            self.ws._rows.close()
+        self.ws._writer.close()
+        self.ws._writer.cleanup()
+
+
+class CsvGzExport:
+    """CSV в gzip: сырые значения колонок, заголовок — имена полей."""
+
+    def __init__(self):
+        self.buffer = io.BytesIO()
+        self.gz = gzip.GzipFile(fileobj=self.buffer, mode="wb", compresslevel=6)
+        self.text = io.TextIOWrapper(self.gz, encoding="utf-8", newline="")
+        self.writer = csv.writer(self.text)
+        self.writer.writerow(EXPORT_FIELDS)
+
+    def append_rows(self, rows) -> int:
+        self.writer.writerows(rows)
+        return self.buffer.tell()
+
+    def finish(self) -> bytes:
+        self.text.close()
+        return self.buffer.getvalue()
+
+    def close(self):
+        self.text.close()
+
+
+class ColumnarExport:
+    """
+    Колоночный снимок: gzip NDJSON. Первая строка — {"columns": [...]},
+    далее по строке на пачку: {"rows": n, "data": [[значения колонки], ...]}.
+    """
+
+    def __init__(self):
+        self.buffer = io.BytesIO()
+        self.gz = gzip.GzipFile(fileobj=self.buffer, mode="wb", compresslevel=6)
+        self._write({"columns": EXPORT_FIELDS})
+
+    def _write(self, obj):
+        line = json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+        self.gz.write(line.encode("utf-8") + b"\n")
+
+    def append_rows(self, rows) -> int:
+        if rows:
+            self._write({"rows": len(rows), "data": [list(col) for col in zip(*rows)]})
+        return self.buffer.tell()
+
+    def finish(self) -> bytes:
+        self.gz.close()
+        return self.buffer.getvalue()
+
+    def close(self):
+        self.gz.close()
+
+
+# Формат -> (класс записи, расширение файла)
+EXPORT_FORMATS = {
+    "xlsx": (XlsxExport, "xlsx"),
+    "csv": (CsvGzExport, "csv.gz"),
+    "columnar": (ColumnarExport, "cols.ndjson.gz"),
+}
+
+class ExportStream:
+    """
+    Части одной выгрузки по мере готовности. Несколько админов могут
+    читать один поток одновременно, каждый со своей позиции.
+    Загруженная часть заменяется своим file_id, и ее байты освобождаются;
+    пока предыдущая часть не загружена, следующая не публикуется.
+    """
+
+    def __init__(self):
+        # (документ или file_id загруженной части, строк в части)
+        self.parts: list[tuple] = []
+        self.finished = False
+        self.error: Exception = None
+        self.readers = 0
+        self._held = 0
+        self._changed = asyncio.Event()
+
+    def publish(self, document: BufferedInputFile, rows: int):
+        self.parts.append((document, rows))
+        self._held += 1
+        self._notify()
+
+    def release(self, index: int, file_id: str):
+        """Часть index загружена: дальше отдается ее file_id."""
+
+        document, rows = self.parts[index]
+        if isinstance(document, BufferedInputFile):
+            self.parts[index] = (file_id, rows)
+            self._held -= 1
+            self._notify()
+
+    async def wait_room(self) -> bool:
+        """
+        Ждет загрузки опубликованной части. False — читателей не осталось
+        и дальше строить выгрузку незачем.
+        """
+
+        while self._held:
+            if not self.readers:
+                return False
+            await self._changed.wait()
+        return True
+
+    def close(self, error: Exception = None):
+        self.finished = True
+        self.error = error
+        self._notify()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def __aiter__(self):
+        position = 0
+        self.readers += 1
+        try:
+            while True:
+                changed = self._changed
+                while position < len(self.parts):
+                    yield self.parts[position]
+                    position += 1
+                if self.finished:
+                    if self.error:
+                        raise self.error
+                    return
+                await changed.wait()
+        finally:
+            self.readers -= 1
+            self._notify()
+
+
+# Один поток на все выгрузки: параллельные запросы не множат нагрузку на CPU.
+_export_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="export")
+_inflight: dict[tuple, ExportStream] = {}
+
+# Формат -> (версия данных, [(file_id, строк в части), ...])
+_uploaded: dict[str, tuple[int, list[tuple[str, int]]]] = {}
+
+
+async def build_export(fmt: str, stream: ExportStream):
+    """
+    Читает строки из БД в event loop и передает их пачками в поток
+    выгрузки; в очереди не больше EXPORT_QUEUE_SIZE пачек. Файл режется
+    на части не длиннее EXPORT_PART_ROWS строк и примерно не больше
+    EXPORT_PART_BYTES; каждая часть публикуется в stream, как только
+    загружена предыдущая, так что в памяти не больше двух частей.
+    """
+
+    export_cls, extension = EXPORT_FORMATS[fmt]
+    stamp = datetime.now().strftime('%Y-%m-%d_%H-%M')
+    loop = asyncio.get_running_loop()
+
+    export = None
+    part_rows = 0
+    oversized = False
+    pending = deque()
+
+    async def drain(limit: int):
+        nonlocal oversized
+        while len(pending) > limit:
+            if await pending.popleft() >= EXPORT_PART_BYTES:
+                oversized = True
+
+    async def finish_part():
+        nonlocal export, part_rows, oversized
+        await drain(0)
+        if not await stream.wait_room():
+            raise RuntimeError("Выгрузку больше никто не ждет")
+        data = await loop.run_in_executor(_export_pool, export.finish)
+        filename = f"users_export_{stamp}_part{len(stream.parts) + 1}.{extension}"
+        stream.publish(BufferedInputFile(data, filename=filename), part_rows)
+        export, part_rows, oversized = None, 0, False
+
+    try:
+        async for rows in iter_export_batches():
+            while rows:
+                if export is None:
+                    export = await loop.run_in_executor(_export_pool, export_cls)
+                chunk = rows[:EXPORT_PART_ROWS - part_rows]
+                rows = rows[len(chunk):]
+                pending.append(loop.run_in_executor(_export_pool, export.append_rows, chunk))
+                part_rows += len(chunk)
+                await drain(EXPORT_QUEUE_SIZE - 1)
+                if part_rows >= EXPORT_PART_ROWS or oversized:
+                    await finish_part()
+
+        if export is not None or not stream.parts:
+            if export is None:
+                export = await loop.run_in_executor(_export_pool, export_cls)
+            await finish_part()
+    except Exception as e:
+        # Дожидаемся уже отданных потоку пачек.
+        await asyncio.gather(*pending, return_exceptions=True)
+        stream.close(e)
+    else:
+        stream.close()
+    finally:
+        # Недописанная часть (ошибка или отмена): закрываем в том же
+        # потоке после ее пачек, чтобы не оставить временных файлов.
+        if export is not None:
+            _export_pool.submit(export.close)
+
+
+async def export_results(fmt: str = "xlsx"):
+    """
+    Выгрузка в формате fmt: async-генератор (документ, строк в части,
+    версия данных) по мере готовности частей. Если данные не менялись
+    с прошлой отправки, документы — file_id уже загруженных частей.
+    Если такая же выгрузка уже идет, читает ее части вместо запуска второй.
+    """
+
+    version = await users_version()
+    cached = _uploaded.get(fmt)
+    if cached and cached[0] == version:
+        for file_id, rows in cached[1]:
+            yield file_id, rows, version
+        return
+
+    key = (fmt, version)
+    stream = _inflight.get(key)
+    if stream is None:
+        stream = ExportStream()
+        _inflight[key] = stream
+        task = asyncio.create_task(build_export(fmt, stream))
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    async for document, rows in stream:
+        yield document, rows, version
+
+
+def release_part(fmt: str, version: int, index: int, file_id: str):
+    """Часть index загружена в Telegram: ее байты больше не нужны."""
+
+    stream = _inflight.get((fmt, version))
+    if stream is not None:
+        stream.release(index, file_id)
+
+
+def remember_upload(fmt: str, version: int, parts: list[tuple[str, int]]):
+    """Запоминает file_id всех отправленных частей для версии данных version."""
+
+    _uploaded[fmt] = (version, parts)
@@ -0,0 +1,105 @@
+"""Буфер FSM на время обработки апдейта."""
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, Mapping, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from aiogram.types import TelegramObject
+
+# Обращения к хранилищу FSM: updates — апдейты с контекстом FSM,
+# storage_ops — все чтения и записи, включая чтение состояния aiogram.
+fsm_stats: Counter = Counter()
+
+
+class BufferedFSMContext(FSMContext):
+    """
+    FSMContext, который читает данные из хранилища не больше одного раза
+    и копит изменения до flush(). Состояние уже прочитано aiogram.
+    """
+
+    def __init__(self, storage: BaseStorage, key: StorageKey, raw_state: Optional[str]):
+        super().__init__(storage=storage, key=key)
+        self._state = raw_state
+        self._data: Optional[Dict[str, Any]] = None
+        self._state_dirty = False
+        self._data_dirty = False
+        self.ops = 0
+
+    async def set_state(self, state: StateType = None) -> None:
+        self._state = state.state if isinstance(state, State) else state
+        self._state_dirty = True
+
+    async def get_state(self) -> Optional[str]:
+        return self._state
+
+    async def _load_data(self) -> Dict[str, Any]:
+        if self._data is None:
+            self._data = await self.storage.get_data(key=self.key)
+            self.ops += 1
+        return self._data
+
+    async def set_data(self, data: Mapping[str, Any]) -> None:
+        self._data = dict(data)
+        self._data_dirty = True
+
+    async def get_data(self) -> Dict[str, Any]:
+        return dict(await self._load_data())
+
+    async def get_value(self, key: str, default: Any = None) -> Any:
+        return (await self._load_data()).get(key, default)
+
+    async def update_data(self, data: Mapping[str, Any] = None, **kwargs: Any) -> Dict[str, Any]:
+        if data:
+            kwargs.update(data)
+        current = await self._load_data()
+        current.update(kwargs)
+        self._data_dirty = True
+        return dict(current)
+
+    async def flush(self):
+        """Записывает накопленное. Состояние и данные разом, если хранилище умеет."""
+
+        if self._state_dirty and self._data_dirty and hasattr(self.storage, "set_record"):
+            await self.storage.set_record(self.key, self._state, self._data)
+            self.ops += 1
+        else:
+            if self._state_dirty:
+                await self.storage.set_state(key=self.key, state=self._state)
+                self.ops += 1
+            if self._data_dirty:
+                await self.storage.set_data(key=self.key, data=self._data)
+                self.ops += 1
+        self._state_dirty = self._data_dirty = False
+
+
+class BufferedFSMMiddleware(BaseMiddleware):
+    """
+    Подменяет FSMContext апдейта на BufferedFSMContext и сохраняет
+    изменения одной записью после обработчика. Если обработчик упал,
+    изменения отбрасываются: наполовину выполненный переход не
+    сохраняется, участник остается в прежнем состоянии. Регистрируется
+    на dp.update после встроенного FSMContextMiddleware.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+
+        context = data.get("state")
+        if context is None:
+            return await handler(event, data)
+
+        buffered = BufferedFSMContext(context.storage, context.key, data.get("raw_state"))
+        data["state"] = buffered
+        try:
+            result = await handler(event, data)
+            await buffered.flush()
+            return result
+        finally:
+            fsm_stats["updates"] += 1
+            fsm_stats["storage_ops"] += buffered.ops + 1
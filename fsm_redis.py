@@ -0,0 +1,29 @@
+"""RedisStorage с TTL, который не трогает диалоги с организатором."""
+from typing import Any, Mapping
+
+from aiogram.fsm.storage.base import StateType, StorageKey
+from aiogram.fsm.storage.redis import RedisStorage
+
+from fsm_storage import TTL_EXEMPT_STATES, _state_name
+
+
+class DialogAwareRedisStorage(RedisStorage):
+    """
+    Redis сам удаляет ключи по state_ttl/data_ttl. Ключи чатов в
+    TTL_EXEMPT_STATES хранятся без срока, пока диалог не закрыт; при
+    выходе из него срок ставится снова.
+    """
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await super().set_state(key, state)
+        data_key = self.key_builder.build(key, "data")
+        if _state_name(state) in TTL_EXEMPT_STATES:
+            await self.redis.persist(self.key_builder.build(key, "state"))
+            await self.redis.persist(data_key)
+        elif self.data_ttl:
+            await self.redis.expire(data_key, self.data_ttl)
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        await super().set_data(key, data)
+        if data and self.data_ttl and await self.get_state(key) in TTL_EXEMPT_STATES:
+            await self.redis.persist(self.key_builder.build(key, "data"))
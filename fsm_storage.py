@@ -0,0 +1,370 @@
+"""Хранилища FSM: в памяти, в PostgreSQL или в Redis."""
+import asyncio
+import json
+import sys
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import (
+    BaseStorage,
+    DefaultKeyBuilder,
+    KeyBuilder,
+    StateType,
+    StorageKey,
+)
+from aiogram.fsm.storage.memory import MemoryStorage
+from sqlalchemy import delete, func, or_, select, text, update
+from sqlalchemy.dialects.postgresql import insert
+
+from config import (
+    FSM_SESSION_TTL,
+    FSM_STORAGE,
+    FSM_SWEEP_INTERVAL,
+    REDIS_URL,
+    AdminPanel,
+    UserState,
+)
+from models import FsmRecord, async_session
+
+# Диалоги с организатором живут, пока их не закроют, а не по таймеру.
+TTL_EXEMPT_STATES = frozenset({AdminPanel.in_dialog.state, UserState.in_dialog_with_admin.state})
+
+# (chat_id, user_id, состояние) сброшенного сценария
+Expired = Tuple[int, int, Optional[str]]
+
+
+def _state_name(state: StateType) -> Optional[str]:
+    return state.state if isinstance(state, State) else state
+
+
+class LocalJsonStorage(BaseStorage):
+    """
+    Хранилище в памяти процесса, которое держит данные в JSON, как
+    PostgreSQL и Redis. Для тестов и локального запуска: несериализуемые
+    данные падают сразу, а не после переезда на внешнее хранилище.
+    """
+
+    def __init__(self, key_builder: KeyBuilder = None):
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True)
+        self.states: Dict[str, str] = {}
+        self.data: Dict[str, str] = {}
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        name = _state_name(state)
+        storage_key = self.key_builder.build(key)
+        if name is None:
+            self.states.pop(storage_key, None)
+        else:
+            self.states[storage_key] = name
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return self.states.get(self.key_builder.build(key))
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        storage_key = self.key_builder.build(key)
+        if not data:
+            self.data.pop(storage_key, None)
+        else:
+            self.data[storage_key] = json.dumps(dict(data))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        value = self.data.get(self.key_builder.build(key))
+        return json.loads(value) if value else {}
+
+    def memory_usage(self) -> int:
+        return sum(
+            sys.getsizeof(k) + sys.getsizeof(v)
+            for table in (self.states, self.data)
+            for k, v in table.items()
+        )
+
+    async def close(self) -> None:
+        pass
+
+
+class PgStorage(BaseStorage):
+    """
+    FSM в таблице fsm_states: одна строка на чат, состояние и данные в
+    JSON. Переживает перезапуск и общая для нескольких процессов бота.
+    """
+
+    def __init__(self, key_builder: KeyBuilder = None):
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        name = _state_name(state)
+        async with async_session() as session:
+            await session.execute(
+                insert(FsmRecord)
+                .values(key=self.key_builder.build(key), state=name, data={})
+                .on_conflict_do_update(
+                    index_elements=[FsmRecord.key],
+                    set_={"state": name, "updated_at": func.now()},
+                )
+            )
+            await session.commit()
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        async with async_session() as session:
+            return await session.scalar(
+                select(FsmRecord.state).where(FsmRecord.key == self.key_builder.build(key))
+            )
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        storage_key = self.key_builder.build(key)
+        data = dict(data)
+        async with async_session() as session:
+            if not data:
+                # state.clear(): сначала состояние None, потом пустые данные —
+                # пустая строка удаляется, а не хранится.
+                deleted = await session.execute(
+                    delete(FsmRecord)
+                    .where(FsmRecord.key == storage_key, FsmRecord.state.is_(None))
+                    .returning(FsmRecord.key)
+                )
+                if deleted.first() is None:
+                    await session.execute(
+                        update(FsmRecord)
+                        .where(FsmRecord.key == storage_key)
+                        .values(data={})
+                    )
+            else:
+                await session.execute(
+                    insert(FsmRecord)
+                    .values(key=storage_key, state=None, data=data)
+                    .on_conflict_do_update(
+                        index_elements=[FsmRecord.key],
+                        set_={"data": data, "updated_at": func.now()},
+                    )
+                )
+            await session.commit()
+
+    async def set_record(
+        self, key: StorageKey, state: StateType, data: Mapping[str, Any]
+    ) -> None:
+        """Состояние и данные одним запросом (см. fsm_buffer)."""
+
+        name = _state_name(state)
+        storage_key = self.key_builder.build(key)
+        data = dict(data)
+        async with async_session() as session:
+            if name is None and not data:
+                await session.execute(delete(FsmRecord).where(FsmRecord.key == storage_key))
+            else:
+                await session.execute(
+                    insert(FsmRecord)
+                    .values(key=storage_key, state=name, data=data)
+                    .on_conflict_do_update(
+                        index_elements=[FsmRecord.key],
+                        set_={"state": name, "data": data, "updated_at": func.now()},
+                    )
+                )
+            await session.commit()
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        async with async_session() as session:
+            data = await session.scalar(
+                select(FsmRecord.data).where(FsmRecord.key == self.key_builder.build(key))
+            )
+        return data or {}
+
+    async def expire_idle(self, ttl: float, exempt=frozenset()) -> List[Expired]:
+        """Удаляет записи без изменений дольше ttl (по индексу updated_at)."""
+
+        async with async_session() as session:
+            result = await session.execute(
+                delete(FsmRecord)
+                .where(
+                    FsmRecord.updated_at < func.now() - timedelta(seconds=ttl),
+                    or_(FsmRecord.state.is_(None), FsmRecord.state.not_in(exempt)),
+                )
+                .returning(FsmRecord.key, FsmRecord.state)
+            )
+            rows = result.all()
+            await session.commit()
+
+        expired = []
+        for key, state in rows:
+            # fsm:<bot_id>:<chat_id>[:<thread_id>]:<user_id>
+            parts = key.split(self.key_builder.separator)
+            expired.append((int(parts[2]), int(parts[-1]), state))
+        return expired
+
+    async def stats(self) -> Dict[str, int]:
+        async with async_session() as session:
+            keys = await session.scalar(select(func.count()).select_from(FsmRecord))
+            size = await session.scalar(
+                text("SELECT pg_total_relation_size('fsm_states')")
+            )
+        return {"keys": keys, "memory": size}
+
+    async def close(self) -> None:
+        pass
+
+
+def _deep_size(obj) -> int:
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_deep_size(k) + _deep_size(v) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(_deep_size(item) for item in obj)
+    return size
+
+
+class ExpiringStorage(BaseStorage):
+    """
+    Сбрасывает сценарии FSM, которые не менялись дольше ttl.
+
+    Для локальных хранилищ ключи лежат в OrderedDict в порядке последнего
+    изменения: уборка смотрит только на голову очереди, без полного обхода.
+    Ключа нет в очереди — значит, в хранилище по нему пусто, и чтение не
+    идет во внутреннее хранилище (MemoryStorage заводит запись на каждый
+    get_state). Хранилище с expire_idle (PgStorage) убирает само.
+    """
+
+    def __init__(
+        self,
+        inner: BaseStorage,
+        ttl: float,
+        on_expire: Callable[[int, int, Optional[str]], Awaitable[Any]] = None,
+        exempt=TTL_EXEMPT_STATES,
+    ):
+        self.inner = inner
+        self.ttl = ttl
+        self.on_expire = on_expire
+        self.exempt = exempt
+        self.shared = hasattr(inner, "expire_idle")
+        self._touched: OrderedDict[StorageKey, float] = OrderedDict()
+
+    def _touch(self, key: StorageKey):
+        if not self.shared:
+            self._touched[key] = time.monotonic()
+            self._touched.move_to_end(key)
+
+    def _known(self, key: StorageKey) -> bool:
+        return self.shared or key in self._touched
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self.inner.set_state(key, state)
+        self._touch(key)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        if not self._known(key):
+            return None
+        return await self.inner.get_state(key)
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        await self.inner.set_data(key, data)
+        self._touch(key)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        if not self._known(key):
+            return {}
+        return await self.inner.get_data(key)
+
+    async def set_record(
+        self, key: StorageKey, state: StateType, data: Mapping[str, Any]
+    ) -> None:
+        if hasattr(self.inner, "set_record"):
+            await self.inner.set_record(key, state, data)
+        else:
+            await self.inner.set_state(key, state)
+            await self.inner.set_data(key, data)
+        self._touch(key)
+
+    async def _forget(self, key: StorageKey):
+        await self.inner.set_state(key, None)
+        await self.inner.set_data(key, {})
+        if isinstance(self.inner, MemoryStorage):
+            self.inner.storage.pop(key, None)
+
+    async def sweep(self) -> int:
+        """Сбрасывает просроченные сценарии и уведомляет участников."""
+
+        if self.shared:
+            expired = await self.inner.expire_idle(self.ttl, self.exempt)
+        else:
+            expired = []
+            deadline = time.monotonic() - self.ttl
+            while self._touched:
+                key, touched = next(iter(self._touched.items()))
+                if touched > deadline:
+                    break
+                state = await self.inner.get_state(key)
+                if state in self.exempt:
+                    self._touch(key)
+                    continue
+                del self._touched[key]
+                if state is None and not await self.inner.get_data(key):
+                    await self._forget(key)
+                    continue
+                await self._forget(key)
+                expired.append((key.chat_id, key.user_id, state))
+
+        if self.on_expire:
+            for chat_id, user_id, state in expired:
+                if state is not None:
+                    await self.on_expire(chat_id, user_id, state)
+        return len(expired)
+
+    async def run_sweeper(self, interval: float = FSM_SWEEP_INTERVAL):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                expired = await self.sweep()
+                if expired:
+                    print(f"FSM: сброшено брошенных сценариев: {expired}")
+            except Exception as e:
+                print(f"FSM: ошибка уборки: {e}")
+
+    async def stats(self) -> Dict[str, int]:
+        """Живые ключи FSM и занятая ими память (байт, оценка)."""
+
+        if hasattr(self.inner, "stats"):
+            return await self.inner.stats()
+        if isinstance(self.inner, MemoryStorage):
+            memory = sum(
+                _deep_size(record.data) + _deep_size(record.state)
+                for record in self.inner.storage.values()
+            )
+        else:
+            memory = self.inner.memory_usage()
+        return {"keys": len(self._touched), "memory": memory}
+
+    async def close(self) -> None:
+        await self.inner.close()
+
+
+def create_storage(
+    kind: str = FSM_STORAGE, ttl: float = FSM_SESSION_TTL, on_expire=None
+) -> BaseStorage:
+    """Хранилище FSM по имени из FSM_STORAGE, со сбросом по ttl (0 — без)."""
+
+    if kind == "redis":
+        # redis — необязательная зависимость, нужна только здесь.
+        # Redis удаляет ключи по TTL сам, без уведомлений; диалоги
+        # с организатором DialogAwareRedisStorage держит без срока.
+        from fsm_redis import DialogAwareRedisStorage
+
+        return DialogAwareRedisStorage.from_url(
+            REDIS_URL,
+            key_builder=DefaultKeyBuilder(with_bot_id=True),
+            state_ttl=int(ttl) or None,
+            data_ttl=int(ttl) or None,
+        )
+
+    if kind == "memory":
+        storage = MemoryStorage()
+    elif kind == "json":
+        storage = LocalJsonStorage()
+    elif kind == "postgres":
+        storage = PgStorage()
+    else:
+        raise ValueError(f"Неизвестное хранилище FSM: {kind}")
+
+    if ttl:
+        storage = ExpiringStorage(storage, ttl, on_expire)
+    return storage
@@ -7,10 +7,12 @@ from aiogram.fsm.context import FSMContext
 from aiogram.utils.media_group import MediaGroupBuilder
 from sqlalchemy import select, update
 from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from config import AdminBanSystem, bot, banned_ids, admin_ids_set, ARCHITECT_ID
 from keyboards import get_admin_panel_kb, get_search_method_kb
-from models import User, BannedUser, async_session
+from models import USER_SNAPSHOT_COLUMNS, BannedUser, User, UserSnapshot, username_is
+from sender import DeliveryFailed, scheduler
 
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
@@ -44,7 +46,9 @@ async def ban_method_chosen(callback: types.CallbackQuery, state: FSMContext):
 
 
 @admin_ban_router.message(AdminBanSystem.waiting_for_ban_user_id)
-async def process_ban_id(message: types.Message, state: FSMContext):
+async def process_ban_id(
+    message: types.Message, state: FSMContext, session: AsyncSession
+):
     """Поиск по id."""
 
     if not message.text.isdigit():
@@ -54,11 +58,13 @@ async def process_ban_id(message: types.Message, state: FSMContext):
         return
 
     user_id = int(message.text)
-    await check_and_proceed_ban(message, state, user_id=user_id)
+    await check_and_proceed_ban(message, state, session, user_id=user_id)
 
 
 @admin_ban_router.message(AdminBanSystem.waiting_for_ban_username)
-async def process_ban_username(message: types.Message, state: FSMContext):
+async def process_ban_username(
+    message: types.Message, state: FSMContext, session: AsyncSession
+):
     """Поиск по username."""
 
     if not message.text.startswith("@"):
@@ -69,31 +75,35 @@ async def process_ban_username(message: types.Message, state: FSMContext):
         return
 
     username = message.text.strip().replace("@", "")
-    await check_and_proceed_ban(message, state, username=username)
+    await check_and_proceed_ban(message, state, session, username=username)
 
 
 async def check_and_proceed_ban(
-    message: types.Message, state: FSMContext, user_id=None, username=None
+    message: types.Message,
+    state: FSMContext,
+    session: AsyncSession,
+    user_id=None,
+    username=None,
 ):
-    async with async_session() as session:
-        """Общая првоерка и переход к причине."""
+    """Общая првоерка и переход к причине."""
 
-        query = select(User)
-        if user_id:
-            query = query.where(User.telegram_id == user_id)
-        else:
-            query = query.where(User.username == username)
+    query = select(*USER_SNAPSHOT_COLUMNS)
+    if user_id:
+        query = query.where(User.telegram_id == user_id)
+    else:
+        query = query.where(username_is(username))
 
-        result = await session.execute(query)
-        user = result.scalar()
+    row = (await session.execute(query)).first()
+    await session.commit()
 
-    if not user:
+    if not row:
         await message.answer(
             "❌ Пользователь не найден в базе данных.\n"
             "Проверьте данные и введите их снова (или нажмите 'На главную' для отмены):"
         )
         return
 
+    user = UserSnapshot(*row)
     if user.telegram_id in admin_ids_set or user.telegram_id == ARCHITECT_ID:
         await message.answer(
             "⚠️ <b>Этот человек, как и вы, является админом.</b>\n"
@@ -129,12 +139,15 @@ async def process_ban_reason(message: types.Message, state: FSMContext):
 
 @admin_ban_router.message(AdminBanSystem.waiting_for_ban_proof, F.text | F.photo)
 async def process_ban_finish(
-    message: types.Message, state: FSMContext, album: List[types.Message] = None
+    message: types.Message,
+    state: FSMContext,
+    session: AsyncSession,
+    album: List[types.Message] = None,
 ):
     """Предоставление доказательств бана и окончание."""
 
     data = await state.get_data()
-    target_user: User = data["target_user"]
+    target_user = UserSnapshot(*data["target_user"])
     reason = data["ban_reason"]
 
     proof_db = ""
@@ -168,25 +181,24 @@ async def process_ban_finish(
     admin_info = f"{admin_username}, ID <code>{message.from_user.id}</code>"
     admin_info_db = f"@{message.from_user.username}, ID {message.from_user.id}"
 
-    async with async_session() as session:
-        stmt = update(User).where(User.id == target_user.id).values(is_banned=True)
-        await session.execute(stmt)
-
-        banned_user_data = {
-            "user_id": target_user.telegram_id,
-            "username": target_user.username,
-            "reason": reason,
-            "admin_who_banned": admin_info_db,
-            "proof": proof_db,
-            "admin_who_unbanned": None,
-        }
-
-        insert_stmt = insert(BannedUser).values(**banned_user_data)
-        do_update_stmt = insert_stmt.on_conflict_do_update(
-            index_elements=["user_id"], set_=banned_user_data
-        )
-        await session.execute(do_update_stmt)
-        await session.commit()
+    stmt = update(User).where(User.id == target_user.id).values(is_banned=True)
+    await session.execute(stmt)
+
+    banned_user_data = {
+        "user_id": target_user.telegram_id,
+        "username": target_user.username,
+        "reason": reason,
+        "admin_who_banned": admin_info_db,
+        "proof": proof_db,
+        "admin_who_unbanned": None,
+    }
+
+    insert_stmt = insert(BannedUser).values(**banned_user_data)
+    do_update_stmt = insert_stmt.on_conflict_do_update(
+        index_elements=["user_id"], set_=banned_user_data
+    )
+    await session.execute(do_update_stmt)
+    await session.commit()
 
     banned_ids.add(target_user.telegram_id)
 
@@ -204,40 +216,48 @@ async def process_ban_finish(
         f"📂 <b>Доказательства:</b> {proof_text_for_alert}"
     )
 
-    for admin_id in admin_ids_set:
+    alert_media = None
+    if album:
+        media_group = MediaGroupBuilder()
+        first = True
+        for msg in album:
+            caption = ban_alert if first else None
+            if msg.photo:
+                media_group.add_photo(
+                    media=msg.photo[-1].file_id,
+                    caption=caption,
+                    parse_mode="HTML",
+                )
+            elif msg.document:
+                media_group.add_document(
+                    media=msg.document.file_id,
+                    caption=caption,
+                    parse_mode="HTML",
+                )
+            first = False
+        alert_media = media_group.build()
+
+    for admin_id in list(admin_ids_set):
         try:
-            if album:
-                media_group = MediaGroupBuilder()
-                first = True
-                for msg in album:
-                    caption = ban_alert if first else None
-                    if msg.photo:
-                        media_group.add_photo(
-                            media=msg.photo[-1].file_id,
-                            caption=caption,
-                            parse_mode="HTML",
-                        )
-                    elif msg.document:
-                        media_group.add_document(
-                            media=msg.document.file_id,
-                            caption=caption,
-                            parse_mode="HTML",
-                        )
-                    first = False
-                await bot.send_media_group(chat_id=admin_id, media=media_group.build())
+            if alert_media:
+                await scheduler.send(
+                    admin_id,
+                    lambda: bot.send_media_group(chat_id=admin_id, media=alert_media),
+                    cost=len(alert_media),
+                )
             elif message.photo:
-                await bot.send_photo(
+                await scheduler.send(admin_id, lambda: bot.send_photo(
                     chat_id=admin_id,
                     photo=message.photo[-1].file_id,
                     caption=ban_alert,
                     parse_mode="HTML",
-                )
+                ))
             else:
-                await bot.send_message(
+                await scheduler.send(admin_id, lambda: bot.send_message(
                     chat_id=admin_id, text=ban_alert, parse_mode="HTML"
-                )
-        except Exception:
-            pass
+                ))
+        except DeliveryFailed as e:
+            print(f"Не удалось уведомить админа о бане: {e}")
 
     await message.answer(
         f"✅ Пользователь <b>{target_user.full_name}</b> успешно забанен.\nУведомление отправлено всем администраторам.",
@@ -284,7 +304,9 @@ async def unban_method_chosen(callback: types.CallbackQuery, state: FSMContext):
 
 
 @admin_ban_router.message(AdminBanSystem.waiting_for_unban_user_id)
-async def process_unban_id(message: types.Message, state: FSMContext):
+async def process_unban_id(
+    message: types.Message, state: FSMContext, session: AsyncSession
+):
     """Разбан по id."""
 
     if not message.text.isdigit():
@@ -292,11 +314,13 @@ async def process_unban_id(message: types.Message, state: FSMContext):
             "⚠️ ID должен состоять только из цифр.\nПопробуйте еще раз:"
         )
         return
-    await process_unban_final(message, state, user_id=int(message.text))
+    await process_unban_final(message, state, session, user_id=int(message.text))
 
 
 @admin_ban_router.message(AdminBanSystem.waiting_for_unban_username)
-async def process_unban_username(message: types.Message, state: FSMContext):
+async def process_unban_username(
+    message: types.Message, state: FSMContext, session: AsyncSession
+):
     """Разбан по username."""
 
     if not message.text.startswith("@"):
@@ -307,11 +331,15 @@ async def process_unban_username(message: types.Message, state: FSMContext):
         return
 
     username = message.text.strip().replace("@", "")
-    await process_unban_final(message, state, username=username)
+    await process_unban_final(message, state, session, username=username)
 
 
 async def process_unban_final(
-    message: types.Message, state: FSMContext, user_id=None, username=None
+    message: types.Message,
+    state: FSMContext,
+    session: AsyncSession,
+    user_id=None,
+    username=None,
 ):
     """Окончание процесса разбана."""
 
@@ -323,33 +351,33 @@ async def process_unban_final(
     admin_info = f"{admin_username}, ID <code>{message.from_user.id}</code>"
     admin_info_db = f"@{message.from_user.username}, ID {message.from_user.id}"
 
-    async with async_session() as session:
-        query = select(User)
-        if user_id:
-            query = query.where(User.telegram_id == user_id)
-        else:
-            query = query.where(User.username == username)
-
-        result = await session.execute(query)
-        user = result.scalar()
-
-        if not user:
-            await message.answer(
-                "❌ Пользователь не найден.\nПроверьте данные и попробуйте снова:"
-            )
-            return
-
-        user.is_banned = False
-        stmt = (
-            update(BannedUser)
-            .where(BannedUser.user_id == user.telegram_id)
-            .values(admin_who_unbanned=admin_info_db)
-        )
-        await session.execute(stmt)
+    query = select(User)
+    if user_id:
+        query = query.where(User.telegram_id == user_id)
+    else:
+        query = query.where(username_is(username))
+
+    result = await session.execute(query)
+    user = result.scalar()
+
+    if not user:
         await session.commit()
+        await message.answer(
+            "❌ Пользователь не найден.\nПроверьте данные и попробуйте снова:"
+        )
+        return
+
+    user.is_banned = False
+    stmt = (
+        update(BannedUser)
+        .where(BannedUser.user_id == user.telegram_id)
+        .values(admin_who_unbanned=admin_info_db)
+    )
+    await session.execute(stmt)
+    await session.commit()
 
-        if user.telegram_id in banned_ids:
-            banned_ids.remove(user.telegram_id)
+    if user.telegram_id in banned_ids:
+        banned_ids.remove(user.telegram_id)
 
     user_sign = f"@{user.username}" if user.username else "(Без username)"
     unban_alert = (
@@ -360,13 +388,13 @@ async def process_unban_final(
         f"👮‍♂️ <b>Кто разбанил:</b> {admin_info}"
     )
 
-    for admin_id in admin_ids_set:
+    for admin_id in list(admin_ids_set):
         try:
-            await bot.send_message(
+            await scheduler.send(admin_id, lambda: bot.send_message(
                 chat_id=admin_id, text=unban_alert, parse_mode="HTML"
-            )
-        except Exception:
-            pass
+            ))
+        except DeliveryFailed as e:
+            print(f"Не удалось уведомить админа о разбане: {e}")
 
     await message.answer(
         f"✅ Пользователь <b>{user.full_name}</b> успешно разбанен.",
@@ -11,11 +11,11 @@ from config import (
     AdminState,
     UserState,
     active_alerts,
-    active_dialogs,
     admin_ids_set,
     bot,
     dp,
 )
+from dialogs import dialogs, release_orphans
 from keyboards import get_admin_dialog_kb
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
@@ -36,7 +36,8 @@ async def admin_start_reply(callback: types.CallbackQuery, state: FSMContext):
     current_admin_id = callback.from_user.id
     admin_username = callback.from_user.username
 
-    active_dialogs[user_id] = current_admin_id
+    ended = await dialogs.start(user_id, current_admin_id)
+    await release_orphans(ended, user_id, current_admin_id)
 
     try:
         user_storage_key = StorageKey(
@@ -59,8 +60,7 @@ async def admin_start_reply(callback: types.CallbackQuery, state: FSMContext):
     except Exception as e:
         print(f"CRITICAL ERROR связывания: {e}")
         await callback.message.answer("❌ Ошибка связи с пользователем.")
-        if user_id in active_dialogs:
-            del active_dialogs[user_id]
+        await dialogs.stop(user_id, admin_id=current_admin_id)
         return
 
     await state.update_data(dialog_user_id=user_id)
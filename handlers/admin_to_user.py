@@ -9,7 +9,8 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.storage.base import StorageKey
 from aiogram.utils.media_group import MediaGroupBuilder
 
-from config import AdminPanel, active_dialogs, bot, dp
+from config import AdminPanel, bot, dp
+from dialogs import dialogs
 from keyboards import get_admin_panel_kb
 
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
@@ -28,13 +29,12 @@ async def admin_message_proxy(
     user_id = data.get("dialog_user_id")
 
     if message.text == "❌ Закончить диалог":
-        if user_id in active_dialogs:
-            del active_dialogs[user_id]
+        stopped = user_id and await dialogs.stop(user_id, admin_id=message.from_user.id)
 
         await state.clear()
         await message.answer("Диалог завершен.", reply_markup=get_admin_panel_kb())
 
-        if user_id:
+        if stopped:
             try:
                 user_key = StorageKey(bot_id=bot.id, chat_id=user_id, user_id=user_id)
                 user_ctx = FSMContext(storage=dp.storage, key=user_key)
@@ -52,6 +52,14 @@ async def admin_message_proxy(
     if message.text == "🏠 На главную":
         return
 
+    if user_id and await dialogs.admin_of(user_id) != message.from_user.id:
+        await state.clear()
+        await message.answer(
+            "Диалог уже завершен или его продолжает другой организатор.",
+            reply_markup=get_admin_panel_kb(),
+        )
+        return
+
     if user_id:
         try:
             prefix = "<b>Организатор:</b>\n"
@@ -3,10 +3,9 @@ import os
 import sys
 
 from aiogram import F, Router, types
-from sqlalchemy import select
 
 from keyboards import get_main_kb, get_organizer_kb
-from models import User, async_session
+from profile_cache import get_profile
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
@@ -18,11 +17,7 @@ call = Router()
 async def contact_menu(message: types.Message):
     """Выбор причины для связи с организаторами (с проверкой регистрации)."""
 
-    async with async_session() as session:
-        result = await session.execute(
-            select(User).where(User.telegram_id == message.from_user.id)
-        )
-        user = result.scalar()
+    user = await get_profile(message.from_user.id)
 
     if not user:
         await message.answer(
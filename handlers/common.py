@@ -6,7 +6,8 @@ from aiogram import F, Router, types
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.storage.base import StorageKey
 
-from config import active_dialogs, bot, dp
+from config import bot, dp
+from dialogs import dialogs
 from keyboards import get_main_kb
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
@@ -23,9 +24,7 @@ async def go_to_main(message: types.Message, state: FSMContext):
     user_id = message.from_user.id
 
     dialog_user_id = data.get("dialog_user_id")
-    if dialog_user_id:
-        if dialog_user_id in active_dialogs:
-            del active_dialogs[dialog_user_id]
+    if dialog_user_id and await dialogs.stop(dialog_user_id, admin_id=user_id):
         try:
             user_key = StorageKey(bot_id=bot.id, chat_id=dialog_user_id, user_id=dialog_user_id)
             user_ctx = FSMContext(storage=dp.storage, key=user_key)
@@ -34,9 +33,8 @@ async def go_to_main(message: types.Message, state: FSMContext):
         except Exception:
             pass
 
-    if user_id in active_dialogs:
-        admin_id = active_dialogs[user_id]
-        del active_dialogs[user_id]
+    admin_id = await dialogs.stop(user_id)
+    if admin_id:
         try:
             await bot.send_message(admin_id, "🔕 <b>Участник покинул диалог.</b>", parse_mode="HTML")
         except Exception:
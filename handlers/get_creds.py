@@ -3,9 +3,8 @@ import os
 import sys
 
 from aiogram import F, Router, types
-from sqlalchemy import select
 
-from models import User, async_session
+from profile_cache import get_profile
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
@@ -17,18 +16,14 @@ get_creds = Router()
 async def get_credentials(message: types.Message):
     """Получение логина и пароля."""
 
-    async with async_session() as session:
-        result = await session.execute(
-            select(User).where(User.telegram_id == message.from_user.id)
+    user = await get_profile(message.from_user.id)
+
+    if user:
+        await message.answer(
+            f"Ваши данные:\n"
+            f"Login: `{user.login_id}`\n"
+            f"Password: `{user.plain_password}`",
+            parse_mode="Markdown",
         )
-        user = result.scalar()
-
-        if user:
-            await message.answer(
-                f"Ваши данные:\n"
-                f"Login: `{user.login_id}`\n"
-                f"Password: `{user.plain_password}`",
-                parse_mode="Markdown",
-            )
-        else:
-            await message.answer("Вы еще не зарегистрированы.")
+    else:
+        await message.answer("Вы еще не зарегистрированы.")
@@ -8,8 +8,8 @@ import os
 from aiogram import F, Router, types
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
-from sqlalchemy import select
 from aiogram.types import FSInputFile
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from config import GRADES, bot, Registration, try_delete
 from keyboards import (
@@ -20,20 +20,19 @@ from keyboards import (
     get_confirm_kb,
 )
 
-from models import User, async_session
+from models import insert_registration
+from profile_cache import get_profile, invalidate_profile
 
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
 registration = Router()
 
 
-def generate_credentials(db_id):
-    """Генерация логина и пароля."""
+def generate_password():
+    """Генерация пароля. Логин user<id> выдает БД (см. insert_registration)."""
 
-    login = f"user{db_id}"
     alphabet = string.ascii_letters + string.digits
-    password = "".join(secrets.choice(alphabet) for i in range(20))
-    return login, password
+    return "".join(secrets.choice(alphabet) for i in range(20))
 
 
 @registration.message(Command("start"))
@@ -70,15 +69,11 @@ async def start_register(message: types.Message, state: FSMContext):
 
     await try_delete(bot, message.chat.id, message.message_id)
 
-    async with async_session() as session:
-        result = await session.execute(
-            select(User).where(User.telegram_id == message.from_user.id)
+    if await get_profile(message.from_user.id):
+        msg = await message.answer(
+            "Вы уже зарегистрированы! Получите логин и пароль."
         )
-        if result.scalar():
-            msg = await message.answer(
-                "Вы уже зарегистрированы! Получите логин и пароль."
-            )
-            return
+        return
 
     await state.set_state(Registration.full_name)
 
@@ -303,7 +298,9 @@ async def accept_agreement(message: types.Message, state: FSMContext):
 
 
 @registration.message(Registration.confirm, F.text == "🚀 Подтвердить введенные данные")
-async def finish_registration(message: types.Message, state: FSMContext):
+async def finish_registration(
+    message: types.Message, state: FSMContext, session: AsyncSession
+):
     """Сохранение данных в БД."""
 
     data = await state.get_data()
@@ -312,9 +309,11 @@ async def finish_registration(message: types.Message, state: FSMContext):
     if "last_bot_msg_id" in data:
         await try_delete(bot, message.chat.id, data["last_bot_msg_id"])
 
+    pwd = generate_password()
     try:
-        async with async_session() as session:
-            new_user = User(
+        result = await session.execute(
+            insert_registration(
+                pwd,
                 telegram_id=message.from_user.id,
                 username=message.from_user.username,
                 full_name=data["full_name"],
@@ -324,18 +323,26 @@ async def finish_registration(message: types.Message, state: FSMContext):
                 grade=data["grade"],
                 email=data["email"],
             )
-            session.add(new_user)
-            await session.flush()
-            login, pwd = generate_credentials(new_user.id)
-            new_user.login_id = login
-            new_user.plain_password = pwd
-            await session.commit()
+        )
+        created = result.one_or_none()
+        await session.commit()
+        invalidate_profile(message.from_user.id)
     except Exception as e:
+        await session.rollback()
         await message.answer(f"Ошибка сохранения в БД: {e}")
         return
 
     await state.clear()
 
+    if created is None:
+        await message.answer(
+            "Вы уже зарегистрированы! Получите логин и пароль.",
+            reply_markup=get_main_kb(message.from_user.id),
+        )
+        return
+
+    login = created.login_id
+
     await message.answer(
         f"✅ Регистрация успешна!\n\n"
         f"👤 Ваш User ID: `{login}`\n"
@@ -6,10 +6,12 @@ from aiogram import F, Router, types
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.storage.base import StorageKey
 from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from config import AdminPanel, UserState, active_dialogs, admin_ids_set, bot, dp
+from config import AdminPanel, UserState, admin_ids_set, bot, dp
+from dialogs import dialogs, release_orphans
 from keyboards import get_admin_dialog_kb, get_admin_panel_kb, get_search_method_kb
-from models import User, async_session
+from models import User, username_is
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
@@ -54,16 +56,18 @@ async def setup_id_search(callback: types.CallbackQuery, state: FSMContext):
 
 
 @search.message(AdminPanel.waiting_for_user_search)
-async def process_username_search(message: types.Message, state: FSMContext):
+async def process_username_search(
+    message: types.Message, state: FSMContext, session: AsyncSession
+):
     """Поиск по username."""
 
     username_input = message.text.strip().replace("@", "")
 
-    async with async_session() as session:
-        result = await session.execute(
-            select(User).where(User.username == username_input)
-        )
-        user = result.scalar()
+    result = await session.execute(
+        select(User).where(username_is(username_input))
+    )
+    user = result.scalar()
+    await session.commit()
 
     if not user:
         await message.answer(
@@ -77,7 +81,9 @@ async def process_username_search(message: types.Message, state: FSMContext):
 
 
 @search.message(AdminPanel.waiting_for_user_id)
-async def process_id_search(message: types.Message, state: FSMContext):
+async def process_id_search(
+    message: types.Message, state: FSMContext, session: AsyncSession
+):
     """Поиск по id."""
 
     id_input = message.text.strip()
@@ -88,11 +94,11 @@ async def process_id_search(message: types.Message, state: FSMContext):
 
     user_id = int(id_input)
 
-    async with async_session() as session:
-        result = await session.execute(
-            select(User).where(User.telegram_id == user_id)
-        )
-        user = result.scalar()
+    result = await session.execute(
+        select(User).where(User.telegram_id == user_id)
+    )
+    user = result.scalar()
+    await session.commit()
 
     if not user:
         await message.answer(
@@ -108,7 +114,8 @@ async def process_id_search(message: types.Message, state: FSMContext):
 async def start_dialog_with_user(message: types.Message, state: FSMContext, user):
     """Общая логика соединения для обоих методов поиска."""
 
-    active_dialogs[user.telegram_id] = message.from_user.id
+    ended = await dialogs.start(user.telegram_id, message.from_user.id)
+    await release_orphans(ended, user.telegram_id, message.from_user.id)
 
     await state.set_state(AdminPanel.in_dialog)
     await state.update_data(dialog_user_id=user.telegram_id)
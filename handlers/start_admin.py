@@ -1,17 +1,13 @@
 """Реакции на кнопки Админ-панели и Назад в меню."""
-from datetime import datetime
 import os
 import sys
 
 from aiogram import F, Router, types
 from aiogram.fsm.context import FSMContext
-from aiogram.types import FSInputFile
-import openpyxl
-from sqlalchemy import select
 
 from config import admin_ids_set
-from keyboards import get_admin_panel_kb, get_main_kb
-from models import User, async_session
+from exporter import EXPORT_FORMATS, export_results, release_part, remember_upload
+from keyboards import get_admin_panel_kb, get_export_format_kb, get_main_kb
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
@@ -32,78 +28,56 @@ async def open_admin_panel(message: types.Message, state: FSMContext):
 
 
 @start_admin.message(F.text == "📊 Выгрузить результаты")
-async def export_results(message: types.Message):
-    """Генерация и отправка Excel-файла с результатами."""
+async def choose_export_format(message: types.Message):
+    """Выбор формата выгрузки результатов."""
 
     if message.from_user.id not in admin_ids_set:
         return
 
-    msg = await message.answer("⏳ Формирую таблицу, пожалуйста подождите...")
+    await message.answer(
+        "📊 В каком формате выгрузить результаты?\n\n"
+        "📗 XLSX — для просмотра в Excel\n"
+        "🗜 CSV (gzip) — для скриптов подсчета\n"
+        "📦 Колоночный снимок — компактный дамп для больших таблиц",
+        reply_markup=get_export_format_kb()
+    )
 
+
+@start_admin.callback_query(F.data.startswith("export_"))
+async def send_export(callback: types.CallbackQuery):
+    """Генерация и отправка файла с результатами."""
+
+    if callback.from_user.id not in admin_ids_set:
+        return await callback.answer()
+
+    fmt = callback.data.removeprefix("export_")
+    if fmt not in EXPORT_FORMATS:
+        return await callback.answer()
+
+    await callback.answer()
+    await callback.message.edit_text("⏳ Формирую выгрузку, пожалуйста подождите...")
+
+    uploaded = []
     try:
-        async with async_session() as session:
-            result = await session.execute(
-                select(User).order_by(User.points.desc(), User.full_name)
+        async for document, rows, version in export_results(fmt):
+            sent = await callback.message.answer_document(
+                document,
+                caption=(
+                    f"📊 Выгрузка результатов, часть {len(uploaded) + 1}.\n"
+                    f"Участников в части: {rows}"
+                )
             )
-            users = result.scalars().all()
-
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "Результаты"
-
-        headers = [
-            "ID в БД",
-            "Telegram ID",
-            "Username",
-            "ФИО",
-            "Очки (Points)",
-            "Телефон",
-            "Населенный пункт",
-            "Учебное заведение",
-            "Класс/Курс",
-            "Email",
-            "Логин",
-            "Пароль",
-            "Статус бана"
-        ]
-        ws.append(headers)
-
-        for user in users:
-            row = [
-                user.id,
-                user.telegram_id,
-                f"@{user.username}" if user.username else "Нет",
-                user.full_name,
-                user.points,
-                user.phone,
-                user.place_of_study,
-                user.school,
-                user.grade,
-                user.email,
-                user.login_id,
-                user.plain_password,
-                "ЗАБАНЕН" if user.is_banned else "-"
-            ]
-            ws.append(row)
-
-        for col_num, column_title in enumerate(headers, 1):
-            letter = openpyxl.utils.get_column_letter(col_num)
-            ws.column_dimensions[letter].width = 20
-
-        filename = f"users_export_{datetime.now().strftime('%Y-%m-%d_%H-%M')}.xlsx"
-        wb.save(filename)
-
-        file_to_send = FSInputFile(filename)
-        await message.answer_document(
-            file_to_send,
-            caption=f"📊 Выгрузка результатов.\nВсего участников: {len(users)}"
-        )
+            release_part(fmt, version, len(uploaded), sent.document.file_id)
+            uploaded.append((sent.document.file_id, rows))
 
-        os.remove(filename)
-        await msg.delete()
+        remember_upload(fmt, version, uploaded)
+        await callback.message.edit_text(
+            f"✅ Выгрузка готова.\n"
+            f"Всего участников: {sum(rows for _, rows in uploaded)}, частей: {len(uploaded)}"
+        )
 
     except Exception as e:
-        await message.answer(f"❌ Произошла ошибка при создании таблицы: {e}")
+        await callback.message.answer(f"❌ Произошла ошибка при создании выгрузки: {e}")
         print(f"Export Error: {e}")
 
 
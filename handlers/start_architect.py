@@ -1,20 +1,40 @@
 """Панель Архитектора: управление админами и рассылка кредов."""
-import asyncio
 import os
 import sys
 
 from aiogram import F, Router, types
 from aiogram.fsm.context import FSMContext
-from sqlalchemy import select
-
-from config import ARCHITECT_ID, ArchitectState, admin_ids_set, bot
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from broadcaster import run_broadcast
+from config import (
+    ARCHITECT_ID,
+    DB_PGBOUNCER,
+    ArchitectState,
+    admin_ids_set,
+    bot,
+    dp,
+)
+from fsm_buffer import fsm_stats
 from keyboards import get_architect_kb, get_main_kb, get_search_method_kb
-from models import User, async_session
+from middlewares import db_stats
+from models import (
+    User,
+    async_session,
+    creds_fingerprint,
+    creds_not_delivered,
+    iter_users,
+    pool_stats,
+    username_is,
+)
 
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
 architect_router = Router()
 
+CREDS_SAVE_CHUNK = 200
+
 
 @architect_router.message(F.text == "🛜 Панель Архитектора")
 async def open_architect_panel(message: types.Message, state: FSMContext):
@@ -54,52 +74,61 @@ async def promote_method_chosen(callback: types.CallbackQuery, state: FSMContext
 
 
 @architect_router.message(ArchitectState.waiting_for_promote_user_id)
-async def process_promote_id(message: types.Message, state: FSMContext):
+async def process_promote_id(
+    message: types.Message, state: FSMContext, session: AsyncSession
+):
     """Проверка id."""
 
     if not message.text.isdigit():
         await message.answer("ID должен быть числом.")
         return
-    await process_promote_final(message, state, user_id=int(message.text))
+    await process_promote_final(message, state, session, user_id=int(message.text))
 
 
 @architect_router.message(ArchitectState.waiting_for_promote_username)
-async def process_promote_username(message: types.Message, state: FSMContext):
+async def process_promote_username(
+    message: types.Message, state: FSMContext, session: AsyncSession
+):
     """Поиск по username."""
 
     if not message.text.startswith("@"):
         await message.answer("Нужен @username.")
         return
     username = message.text.strip().replace("@", "")
-    await process_promote_final(message, state, username=username)
+    await process_promote_final(message, state, session, username=username)
 
 
 async def process_promote_final(
-    message: types.Message, state: FSMContext, user_id=None, username=None
+    message: types.Message,
+    state: FSMContext,
+    session: AsyncSession,
+    user_id=None,
+    username=None,
 ):
-    async with async_session() as session:
-        """Окончание процесса назначения админа."""
-
-        query = select(User)
-        if user_id:
-            query = query.where(User.telegram_id == user_id)
-        else:
-            query = query.where(User.username == username)
-        user = (await session.execute(query)).scalar()
-
-        if not user:
-            await message.answer("Пользователь не найден.")
-            return
+    """Окончание процесса назначения админа."""
 
-        if user.is_admin:
-            await message.answer("Этот пользователь уже админ.")
-            await state.clear()
-            return
+    query = select(User)
+    if user_id:
+        query = query.where(User.telegram_id == user_id)
+    else:
+        query = query.where(username_is(username))
+    user = (await session.execute(query.with_for_update())).scalar()
+
+    if not user:
+        await session.commit()
+        await message.answer("Пользователь не найден.")
+        return
 
-        user.is_admin = True
+    if user.is_admin:
         await session.commit()
+        await message.answer("Этот пользователь уже админ.")
+        await state.clear()
+        return
+
+    user.is_admin = True
+    await session.commit()
 
-        admin_ids_set.add(user.telegram_id)
+    admin_ids_set.add(user.telegram_id)
 
     await message.answer(
         f"✅ Пользователь {user.full_name} назначен АДМИНОМ.",
@@ -145,53 +174,62 @@ async def demote_method_chosen(callback: types.CallbackQuery, state: FSMContext)
 
 
 @architect_router.message(ArchitectState.waiting_for_demote_user_id)
-async def process_demote_id(message: types.Message, state: FSMContext):
+async def process_demote_id(
+    message: types.Message, state: FSMContext, session: AsyncSession
+):
     """Поиск по id."""
 
     if not message.text.isdigit():
         await message.answer("ID должен быть числом.")
         return
-    await process_demote_final(message, state, user_id=int(message.text))
+    await process_demote_final(message, state, session, user_id=int(message.text))
 
 
 @architect_router.message(ArchitectState.waiting_for_demote_username)
-async def process_demote_username(message: types.Message, state: FSMContext):
+async def process_demote_username(
+    message: types.Message, state: FSMContext, session: AsyncSession
+):
     """Поиск по username."""
 
     if not message.text.startswith("@"):
         await message.answer("Нужен @username.")
         return
     username = message.text.strip().replace("@", "")
-    await process_demote_final(message, state, username=username)
+    await process_demote_final(message, state, session, username=username)
 
 
 async def process_demote_final(
-    message: types.Message, state: FSMContext, user_id=None, username=None
+    message: types.Message,
+    state: FSMContext,
+    session: AsyncSession,
+    user_id=None,
+    username=None,
 ):
-    async with async_session() as session:
-        """Окончание процесса снятия админа."""
-
-        query = select(User)
-        if user_id:
-            query = query.where(User.telegram_id == user_id)
-        else:
-            query = query.where(User.username == username)
-        user = (await session.execute(query)).scalar()
-
-        if not user:
-            await message.answer("Пользователь не найден.")
-            return
+    """Окончание процесса снятия админа."""
 
-        if not user.is_admin:
-            await message.answer("Этот пользователь не является админом.")
-            await state.clear()
-            return
+    query = select(User)
+    if user_id:
+        query = query.where(User.telegram_id == user_id)
+    else:
+        query = query.where(username_is(username))
+    user = (await session.execute(query.with_for_update())).scalar()
+
+    if not user:
+        await session.commit()
+        await message.answer("Пользователь не найден.")
+        return
 
-        user.is_admin = False
+    if not user.is_admin:
         await session.commit()
+        await message.answer("Этот пользователь не является админом.")
+        await state.clear()
+        return
 
-        if user.telegram_id in admin_ids_set:
-            admin_ids_set.remove(user.telegram_id)
+    user.is_admin = False
+    await session.commit()
+
+    if user.telegram_id in admin_ids_set:
+        admin_ids_set.remove(user.telegram_id)
 
     await message.answer(
         f"✅ Пользователь {user.full_name} разжалован (права сняты).",
@@ -213,33 +251,110 @@ async def process_demote_final(
 
 @architect_router.message(F.text == "📨 Разослать креды")
 async def broadcast_creds(message: types.Message):
-    """Рассылка данных для входа."""
+    """Рассылка данных для входа всем участникам."""
 
     if message.from_user.id != ARCHITECT_ID:
         return
+    await mail_creds(message, only_new=False)
+
+
+@architect_router.message(F.text == "📨 Дослать креды новым")
+async def broadcast_creds_delta(message: types.Message):
+    """Рассылка только тем, кто еще не получал креды или у кого они изменились."""
+
+    if message.from_user.id != ARCHITECT_ID:
+        return
+    await mail_creds(message, only_new=True)
+
+
+async def mail_creds(message: types.Message, only_new: bool):
+    """Общая логика рассылки кредов с учетом доставленных."""
 
     msg = await message.answer("⏳ Начинаю массовую рассылку логинов и паролей...")
 
-    async with async_session() as session:
-        result = await session.execute(select(User))
-        users = result.scalars().all()
-
-    count = 0
-    for user in users:
-        try:
-            creds_text = (
-                f"🔔 Ваши данные для входа:\n"
-                f"Login: `{user.login_id}`\n"
-                f"Password: `{user.plain_password}`"
-            )
-            await bot.send_message(user.telegram_id, creds_text, parse_mode="Markdown")
-            count += 1
-            await asyncio.sleep(0.05)
-        except Exception:
-            pass
+    delivered = []
+
+    async def save_delivered():
+        chunk = delivered[:]
+        delivered.clear()
+        async with async_session() as session:
+            await session.execute(update(User), chunk)
+            await session.commit()
+
+    async def on_result(user, error):
+        if error:
+            return
+        delivered.append({
+            "id": user.id,
+            "creds_sent_hash": creds_fingerprint(user.login_id, user.plain_password),
+        })
+        if len(delivered) >= CREDS_SAVE_CHUNK:
+            await save_delivered()
+
+    async def send_creds(user):
+        creds_text = (
+            f"🔔 Ваши данные для входа:\n"
+            f"Login: `{user.login_id}`\n"
+            f"Password: `{user.plain_password}`"
+        )
+        await bot.send_message(user.telegram_id, creds_text, parse_mode="Markdown")
+
+    where = (~User.is_unreachable,)
+    if only_new:
+        where += (creds_not_delivered(),)
+
+    recipients = iter_users(
+        User.telegram_id,
+        User.login_id,
+        User.plain_password,
+        where=where,
+    )
+    try:
+        count, _ = await run_broadcast(recipients, send_creds, on_result=on_result)
+    finally:
+        if delivered:
+            await save_delivered()
 
     await message.answer(
         f"✅ Рассылка завершена. Отправлено: {count} пользователям.",
         reply_markup=get_architect_kb(),
     )
     await msg.delete()
+
+
+@architect_router.message(F.text == "📈 Состояние БД")
+async def show_db_stats(message: types.Message):
+    """Состояние пула соединений и работа с БД из апдейтов."""
+
+    if message.from_user.id != ARCHITECT_ID:
+        return
+
+    pool = pool_stats()
+    fsm_ops_per_update = (
+        fsm_stats["storage_ops"] / fsm_stats["updates"] if fsm_stats["updates"] else 0.0
+    )
+    mode = "PgBouncer (transaction)" if DB_PGBOUNCER else "прямое подключение"
+    storage = dp.fsm.storage
+    fsm_keys = ""
+    if hasattr(storage, "stats"):
+        keys = await storage.stats()
+        fsm_keys = (
+            f"\nЖивых ключей: {keys['keys']}, "
+            f"память: {keys['memory'] / 1024:.1f} КБ"
+        )
+    await message.answer(
+        f"📈 <b>Пул соединений</b> ({mode})\n"
+        f"Занято: {pool['checked_out']} из {pool['size']} "
+        f"(+{pool['overflow']}/{pool['max_overflow']} сверх пула)\n"
+        f"Свободно: {pool['idle']}\n"
+        f"Выдач: {pool['checkouts']}, таймаутов: {pool['timeouts']}\n"
+        f"Ожидание: в среднем {pool['wait_avg_ms']:.1f} мс, "
+        f"максимум {pool['wait_max_ms']:.1f} мс\n\n"
+        f"<b>Апдейты</b>\n"
+        f"Всего: {db_stats['updates']}, с запросами к БД: {db_stats['updates_with_db']}\n"
+        f"Транзакций: {db_stats['transactions']}, откатов: {db_stats['rollbacks']}\n\n"
+        f"<b>FSM</b>\n"
+        f"Обращений к хранилищу на апдейт: {fsm_ops_per_update:.2f}"
+        f"{fsm_keys}",
+        parse_mode="HTML",
+    )
@@ -1,17 +1,28 @@
 """Рассылка сообщений участникам."""
-import asyncio
 import os
 import sys
 from typing import List
 
 from aiogram import F, Router, types
 from aiogram.fsm.context import FSMContext
-from aiogram.utils.media_group import MediaGroupBuilder
-from sqlalchemy import select
-
-from config import AdminPanel, admin_ids_set, bot
-from keyboards import get_admin_panel_kb
-from models import User, async_session
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from broadcaster import (
+    create_job,
+    dump_entities,
+    get_run,
+    set_job_status,
+    start_job,
+)
+from config import GRADES, AdminPanel, admin_ids_set
+from keyboards import (
+    get_admin_panel_kb,
+    get_broadcast_segment_kb,
+    get_cancel_kb,
+    get_selection_kb,
+)
+from models import User, segment_where
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
@@ -19,17 +30,118 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 broad = Router()
 
 
+SEGMENT_LABELS = {
+    "place": "населенный пункт",
+    "school": "учебное заведение",
+}
+
+
+async def count_audience(
+    session: AsyncSession, field: str = None, value: str = None
+) -> int:
+    """
+    Число участников, которые получат рассылку. Транзакция сразу
+    завершается: дальше обработчики ходят в Telegram.
+    """
+
+    audience = await session.scalar(
+        select(func.count(User.id))
+        .where(~User.is_unreachable, *segment_where(field, value))
+    )
+    await session.commit()
+    return audience
+
+
 @broad.message(F.text == "📢 Разослать всем")
 async def start_broadcast(message: types.Message, state: FSMContext):
-    """Реакция на нажатие кнопки и ввод сообщения."""
+    """Реакция на нажатие кнопки и выбор аудитории."""
 
     if message.from_user.id not in admin_ids_set:
         return
+    await state.set_state(AdminPanel.choosing_broadcast_segment)
+    await message.answer(
+        "Кому отправить рассылку?", reply_markup=get_broadcast_segment_kb()
+    )
+
+
+@broad.callback_query(AdminPanel.choosing_broadcast_segment, F.data.startswith("bseg_"))
+async def broadcast_segment_chosen(
+    callback: types.CallbackQuery, state: FSMContext, session: AsyncSession
+):
+    """Выбор типа сегмента."""
+
+    field = callback.data.split("_")[1]
+    if field == "all":
+        await ask_broadcast_content(callback.message, state, session)
+    elif field == "grade":
+        await callback.message.edit_text(
+            "Выберите класс или курс:", reply_markup=get_selection_kb(GRADES, "bgrade")
+        )
+    else:
+        await state.update_data(segment_field=field)
+        await state.set_state(AdminPanel.waiting_for_segment_value)
+        await callback.message.edit_text(
+            f"Введите {SEGMENT_LABELS[field]} (регистр не важен):"
+        )
+    await callback.answer()
+
+
+@broad.callback_query(AdminPanel.choosing_broadcast_segment, F.data.startswith("bgrade_"))
+async def broadcast_grade_chosen(
+    callback: types.CallbackQuery, state: FSMContext, session: AsyncSession
+):
+    """Рассылка по классу/курсу."""
+
+    grade = callback.data.split("_")[1]
+    await ask_broadcast_content(callback.message, state, session, "grade", grade)
+    await callback.answer()
+
+
+@broad.message(AdminPanel.waiting_for_segment_value)
+async def broadcast_segment_value(
+    message: types.Message, state: FSMContext, session: AsyncSession
+):
+    """Рассылка по населенному пункту или учебному заведению."""
+
+    data = await state.get_data()
+    if not message.text:
+        await message.answer(
+            f"Введите {SEGMENT_LABELS[data.get('segment_field')]} текстом "
+            "или нажмите «🏠 На главную» для отмены."
+        )
+        return
+
+    await ask_broadcast_content(
+        message, state, session, data.get("segment_field"), message.text.strip()
+    )
+
+
+async def ask_broadcast_content(
+    message: types.Message,
+    state: FSMContext,
+    session: AsyncSession,
+    field: str = None,
+    value: str = None,
+):
+    """Показывает размер аудитории и ждет содержимое рассылки."""
+
+    audience = await count_audience(session, field, value)
+    if not audience:
+        await state.set_state(AdminPanel.choosing_broadcast_segment)
+        await message.answer(
+            "❌ В этом сегменте нет участников. Выберите другой:",
+            reply_markup=get_broadcast_segment_kb(),
+        )
+        return
+
+    await state.update_data(segment_field=field, segment_value=value)
     await state.set_state(AdminPanel.waiting_for_broadcast_content)
     await message.answer(
+        f"👥 Аудитория: <b>{audience}</b> участников.\n"
         "Отправьте сообщение (текст, фото, альбом, файл), которое "
-        "нужно разослать всем участникам.",
-        reply_markup=types.ReplyKeyboardRemove(),
+        "нужно разослать, или нажмите «🏠 На главную» для отмены.",
+        parse_mode="HTML",
+        reply_markup=get_cancel_kb(),
     )
 
 
@@ -37,84 +149,84 @@ async def start_broadcast(message: types.Message, state: FSMContext):
 async def process_broadcast(
     message: types.Message,
     state: FSMContext,
+    session: AsyncSession,
     album: List[types.Message] = None
 ):
     """Начало рассылки сообщений участникам."""
 
-    async with async_session() as session:
-        users_result = await session.execute(select(User.telegram_id))
-        users_ids = users_result.scalars().all()
-
-    count = 0
-    await message.answer(f"⏳ Начинаю рассылку на {len(users_ids)} пользователей...")
-    is_album = False
+    data = await state.get_data()
+    segment_field = data.get("segment_field")
+    segment_value = data.get("segment_value")
+    users_count = await count_audience(session, segment_field, segment_value)
 
+    album_data = None
     if album:
-        is_album = True
-        builder = MediaGroupBuilder()
+        album_data = []
         for element in album:
+            entities = dump_entities(element.caption_entities)
             if element.photo:
-                builder.add_photo(
-                    media=element.photo[-1].file_id,
-                    caption=element.caption,
-                    caption_entities=element.caption_entities
-                )
+                album_data.append(('photo', element.photo[-1].file_id, element.caption, entities))
             elif element.video:
-                builder.add_video(
-                    media=element.video.file_id,
-                    caption=element.caption,
-                    caption_entities=element.caption_entities
-                )
+                album_data.append(('video', element.video.file_id, element.caption, entities))
             elif element.document:
-                builder.add_document(
-                    media=element.document.file_id,
-                    caption=element.caption,
-                    caption_entities=element.caption_entities
-                )
+                album_data.append(('document', element.document.file_id, element.caption, entities))
             elif element.audio:
-                builder.add_audio(
-                    media=element.audio.file_id,
-                    caption=element.caption,
-                    caption_entities=element.caption_entities
-                )
+                album_data.append(('audio', element.audio.file_id, element.caption, entities))
 
-        album_data = []
-        for element in album:
-            if element.photo:
-                album_data.append(('photo', element.photo[-1].file_id, element.caption, element.caption_entities))
-            elif element.video:
-                album_data.append(('video', element.video.file_id, element.caption, element.caption_entities))
-            elif element.document:
-                album_data.append(('document', element.document.file_id, element.caption, element.caption_entities))
-
-    for user_id in users_ids:
-        try:
-            if is_album:
-                mb = MediaGroupBuilder()
-                for m_type, m_id, m_cap, m_ents in album_data:
-                    if m_type == 'photo':
-                        mb.add_photo(m_id, caption=m_cap, caption_entities=m_ents)
-                    elif m_type == 'video':
-                        mb.add_video(m_id, caption=m_cap, caption_entities=m_ents)
-                    elif m_type == 'document':
-                        mb.add_document(m_id, caption=m_cap, caption_entities=m_ents)
-
-                await bot.send_media_group(chat_id=user_id, media=mb.build())
-
-            else:
-                await bot.copy_message(
-                    chat_id=user_id,
-                    from_chat_id=message.chat.id,
-                    message_id=message.message_id,
-                )
-
-            count += 1
-            await asyncio.sleep(0.05)
-        except Exception:
-            pass
+    progress = await message.answer(
+        f"⏳ Начинаю рассылку на {users_count} пользователей...",
+    )
+    job_id = await create_job(
+        session,
+        admin_id=message.from_user.id,
+        from_chat_id=message.chat.id,
+        message_id=message.message_id,
+        album=album_data,
+        total=users_count,
+        progress_message_id=progress.message_id,
+        segment_field=segment_field,
+        segment_value=segment_value,
+    )
+    await start_job(job_id)
+    await state.clear()
 
     await message.answer(
-        f"✅ Рассылка завершена. Отправлено пользователям: {count}",
+        f"Рассылка #{job_id} запущена в фоне. Прогресс обновляется в сообщении выше.",
         reply_markup=get_admin_panel_kb(),
     )
-    await state.clear()
+
+
+@broad.callback_query(F.data.startswith("bc_"))
+async def control_broadcast(callback: types.CallbackQuery):
+    """Пауза, продолжение и отмена рассылки."""
+
+    if callback.from_user.id not in admin_ids_set:
+        await callback.answer("У вас нет прав.", show_alert=True)
+        return
+
+    _, action, job_id = callback.data.split("_")
+    job_id = int(job_id)
+
+    run = get_run(job_id)
+    if run is None and action in ("resume", "cancel"):
+        # Рассылка, оставшаяся на паузе после перезапуска бота.
+        run = await start_job(job_id)
+    if run is None:
+        await callback.answer("Рассылка уже завершена.", show_alert=True)
+        return
+
+    if action == "cancel":
+        run.cancel()
+        await callback.answer("Рассылка отменяется...")
+        return
+
+    if action == "pause":
+        run.pause()
+        await set_job_status(job_id, "paused")
+        await callback.answer("Рассылка на паузе.")
+    else:
+        run.resume()
+        await set_job_status(job_id, "running")
+        await callback.answer("Рассылка продолжается.")
+
+    await run.show_progress()
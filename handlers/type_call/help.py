@@ -10,6 +10,7 @@ from aiogram.utils.media_group import MediaGroupBuilder
 
 from config import Support, active_alerts, admin_ids_set, bot, try_delete
 from keyboards import get_main_kb
+from sender import DeliveryFailed, scheduler
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '...'))
 
@@ -73,52 +74,59 @@ async def forward_to_admin(
 
     sent_messages_info = []
 
-    for admin_id in admin_ids_set:
+    help_media = None
+    if album:
+        media_group = MediaGroupBuilder()
+        for msg in album:
+            if msg.photo:
+                media_group.add_photo(media=msg.photo[-1].file_id)
+            elif msg.document:
+                media_group.add_document(media=msg.document.file_id)
+            elif msg.video:
+                media_group.add_video(media=msg.video.file_id)
+        help_media = media_group.build()
+
+    for admin_id in list(admin_ids_set):
         try:
-            if album:
-                media_group = MediaGroupBuilder()
-                for msg in album:
-                    if msg.photo:
-                        media_group.add_photo(media=msg.photo[-1].file_id)
-                    elif msg.document:
-                        media_group.add_document(media=msg.document.file_id)
-                    elif msg.video:
-                        media_group.add_video(media=msg.video.file_id)
-
-                await bot.send_media_group(chat_id=admin_id, media=media_group.build())
-
-                sent_msg = await bot.send_message(
+            if help_media:
+                await scheduler.send(
+                    admin_id,
+                    lambda: bot.send_media_group(chat_id=admin_id, media=help_media),
+                    cost=len(help_media),
+                )
+
+                sent_msg = await scheduler.send(admin_id, lambda: bot.send_message(
                     chat_id=admin_id,
                     text=full_text_msg,
                     parse_mode="HTML",
                     reply_markup=kb
-                )
+                ))
                 sent_messages_info.append((admin_id, sent_msg.message_id))
 
             elif message.photo or message.document:
                 file_id = message.photo[-1].file_id if message.photo else message.document.file_id
                 method = bot.send_photo if message.photo else bot.send_document
 
-                sent_msg = await method(
+                sent_msg = await scheduler.send(admin_id, lambda: method(
                     chat_id=admin_id,
                     photo=file_id if message.photo else None,
                     document=file_id if message.document else None,
                     caption=full_text_msg,
                     parse_mode="HTML",
                     reply_markup=kb
-                )
+                ))
                 sent_messages_info.append((admin_id, sent_msg.message_id))
 
             else:
-                sent_msg = await bot.send_message(
+                sent_msg = await scheduler.send(admin_id, lambda: bot.send_message(
                     chat_id=admin_id,
                     text=full_text_msg,
                     parse_mode="HTML",
                     reply_markup=kb
-                )
+                ))
                 sent_messages_info.append((admin_id, sent_msg.message_id))
 
-        except Exception as e:
+        except DeliveryFailed as e:
             print(f"Ошибка при отправке админу {admin_id}: {e}")
 
     if sent_messages_info:
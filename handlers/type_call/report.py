@@ -10,6 +10,7 @@ from aiogram.utils.media_group import MediaGroupBuilder
 
 from config import Report, active_alerts, admin_ids_set, bot, try_delete
 from keyboards import get_main_kb
+from sender import DeliveryFailed, scheduler
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '...'))
 
@@ -108,46 +109,53 @@ async def process_report_proof(
 
     sent_messages_info = []
 
-    for admin_id in admin_ids_set:
-        try:
-            if album:
-                media_group = MediaGroupBuilder()
-                for msg in album:
-                    if msg.photo:
-                        media_group.add_photo(media=msg.photo[-1].file_id)
-                    elif msg.document:
-                        media_group.add_document(media=msg.document.file_id)
+    proof_media = None
+    if album:
+        media_group = MediaGroupBuilder()
+        for msg in album:
+            if msg.photo:
+                media_group.add_photo(media=msg.photo[-1].file_id)
+            elif msg.document:
+                media_group.add_document(media=msg.document.file_id)
+        proof_media = media_group.build()
 
-                await bot.send_media_group(chat_id=admin_id, media=media_group.build())
+    for admin_id in list(admin_ids_set):
+        try:
+            if proof_media:
+                await scheduler.send(
+                    admin_id,
+                    lambda: bot.send_media_group(chat_id=admin_id, media=proof_media),
+                    cost=len(proof_media),
+                )
 
-                sent_msg = await bot.send_message(
+                sent_msg = await scheduler.send(admin_id, lambda: bot.send_message(
                     chat_id=admin_id,
                     text=report_text,
                     parse_mode="HTML",
                     reply_markup=kb
-                )
+                ))
                 sent_messages_info.append((admin_id, sent_msg.message_id))
 
             elif message.photo:
-                sent_msg = await bot.send_photo(
+                sent_msg = await scheduler.send(admin_id, lambda: bot.send_photo(
                     chat_id=admin_id,
                     photo=message.photo[-1].file_id,
                     caption=report_text,
                     parse_mode="HTML",
                     reply_markup=kb
-                )
+                ))
                 sent_messages_info.append((admin_id, sent_msg.message_id))
 
             else:
-                sent_msg = await bot.send_message(
+                sent_msg = await scheduler.send(admin_id, lambda: bot.send_message(
                     chat_id=admin_id,
                     text=report_text,
                     parse_mode="HTML",
                     reply_markup=kb
-                )
+                ))
                 sent_messages_info.append((admin_id, sent_msg.message_id))
 
-        except Exception as e:
+        except DeliveryFailed as e:
             print(f"Ошибка отправки админу {admin_id}: {e}")
 
     if sent_messages_info:
@@ -6,6 +6,7 @@ from aiogram import F, Router, types
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 
 from config import active_alerts, admin_ids_set, bot
+from sender import DeliveryFailed, scheduler
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
@@ -46,17 +47,17 @@ async def process_ban_appeal(callback: types.CallbackQuery):
 
     sent_messages_info = []
 
-    for admin_id in admin_ids_set:
+    for admin_id in list(admin_ids_set):
         try:
-            sent_msg = await bot.send_message(
+            sent_msg = await scheduler.send(admin_id, lambda: bot.send_message(
                 chat_id=admin_id,
                 text=alert_text,
                 parse_mode="HTML",
                 reply_markup=kb
-            )
+            ))
             sent_messages_info.append((admin_id, sent_msg.message_id))
-        except Exception:
-            pass
+        except DeliveryFailed as e:
+            print(f"Ошибка отправки админу {admin_id}: {e}")
 
     if sent_messages_info:
         if user.id not in active_alerts:
@@ -7,7 +7,8 @@ from aiogram import Router, types
 from aiogram.fsm.context import FSMContext
 from aiogram.utils.media_group import MediaGroupBuilder
 
-from config import UserState, active_dialogs, bot
+from config import UserState, bot
+from dialogs import dialogs
 from keyboards import get_admin_dialog_kb
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
@@ -28,7 +29,7 @@ async def user_message_proxy(
     if message.text == "🏠 На главную":
         return
 
-    target_admin_id = active_dialogs.get(user_id)
+    target_admin_id = await dialogs.admin_of(user_id)
     if not target_admin_id:
         await message.answer("Связь прервана. Ожидайте сообщения от организатора.")
         await state.clear()
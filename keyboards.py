@@ -33,7 +33,8 @@ def get_architect_kb():
     return ReplyKeyboardMarkup(
         keyboard=[
             [KeyboardButton(text="➕ Назначить админа"), KeyboardButton(text="➖ Снять админа")],
-            [KeyboardButton(text="📨 Разослать креды")],
+            [KeyboardButton(text="📨 Разослать креды"), KeyboardButton(text="📨 Дослать креды новым")],
+            [KeyboardButton(text="📈 Состояние БД")],
             [KeyboardButton(text="🏠 На главную")]
         ],
         resize_keyboard=True
@@ -153,3 +154,43 @@ def get_search_method_kb():
             ]
         ]
     )
+
+
+def get_broadcast_control_kb(job_id: int, paused: bool):
+    """Управление запущенной рассылкой."""
+
+    if paused:
+        toggle = InlineKeyboardButton(text="▶️ Продолжить", callback_data=f"bc_resume_{job_id}")
+    else:
+        toggle = InlineKeyboardButton(text="⏸ Пауза", callback_data=f"bc_pause_{job_id}")
+
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [toggle, InlineKeyboardButton(text="🚫 Отменить", callback_data=f"bc_cancel_{job_id}")]
+        ]
+    )
+
+
+def get_broadcast_segment_kb():
+    """Выбор аудитории рассылки."""
+
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text="👥 Всем участникам", callback_data="bseg_all")],
+            [InlineKeyboardButton(text="🎓 По классу/курсу", callback_data="bseg_grade")],
+            [InlineKeyboardButton(text="🏙 По населенному пункту", callback_data="bseg_place")],
+            [InlineKeyboardButton(text="🏫 По учебному заведению", callback_data="bseg_school")],
+        ]
+    )
+
+
+def get_export_format_kb():
+    """Выбор формата выгрузки результатов."""
+
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text="📗 Excel (XLSX)", callback_data="export_xlsx")],
+            [InlineKeyboardButton(text="🗜 CSV (gzip)", callback_data="export_csv")],
+            [InlineKeyboardButton(text="📦 Колоночный снимок", callback_data="export_columnar")],
+        ]
+    )
@@ -3,33 +3,81 @@ import asyncio
 
 from sqlalchemy import select
 
-from config import admin_ids_set, banned_ids, bot, dp
+from broadcaster import resume_jobs
+from config import (
+    FSM_EXPIRE_NOTIFY,
+    admin_ids_set,
+    banned_ids,
+    bot,
+    dp,
+    unreachable_ids,
+)
 from handlers.main_handler import router
-from middlewares import BanMiddleware, MediaGroupMiddleware
+from middlewares import (
+    BanMiddleware,
+    DbSessionMiddleware,
+    MediaGroupMiddleware,
+    ReachabilityMiddleware,
+)
+from fsm_buffer import BufferedFSMMiddleware
+from fsm_storage import ExpiringStorage, create_storage
+from keyboards import get_main_kb
 from models import User, async_session, init_db
+from role_cache import listen_roles, load_roles
+from sender import DeliveryFailed, scheduler
 
 
 async def load_cache():
-    """Загрузка кэшей (забаненные и админы) при старте."""
+    """Загрузка кэшей (забаненные, админы, недоступные) при старте."""
+
+    await load_roles()
 
     async with async_session() as session:
+        res_unreachable = await session.execute(
+            select(User.telegram_id).where(User.is_unreachable.is_(True))
+        )
+        unreachable_ids.update(res_unreachable.scalars().all())
+
+    print(
+        f"Кэш загружен: {len(banned_ids)} забаненных, {len(admin_ids_set)} админов, "
+        f"{len(unreachable_ids)} недоступных."
+    )
 
-        res_banned = await session.execute(select(User.telegram_id).where(User.is_banned is True))
-        for uid in res_banned.scalars().all():
-            banned_ids.add(uid)
 
-        res_admins = await session.execute(select(User.telegram_id).where(User.is_admin is True))
-        for uid in res_admins.scalars().all():
-            admin_ids_set.add(uid)
+async def notify_session_expired(chat_id: int, user_id: int, state: str):
+    """Сообщает участнику, что брошенный сценарий сброшен."""
 
-    print(f"Кэш загружен: {len(banned_ids)} забаненных, {len(admin_ids_set)} админов.")
+    try:
+        await scheduler.send(
+            chat_id,
+            lambda: bot.send_message(
+                chat_id,
+                "⌛ Сессия истекла: действие отменено, начните его заново.",
+                reply_markup=get_main_kb(user_id),
+            ),
+        )
+    except DeliveryFailed:
+        pass
 
 
 async def main():
     """Инициализация БД и точка входа."""
 
+    dp.fsm.storage = create_storage(
+        on_expire=notify_session_expired if FSM_EXPIRE_NOTIFY else None
+    )
+    dp.update.outer_middleware(BufferedFSMMiddleware())
     await init_db()
     await load_cache()
+    roles_listener = asyncio.create_task(listen_roles())
+    fsm_sweeper = None
+    if isinstance(dp.fsm.storage, ExpiringStorage):
+        fsm_sweeper = asyncio.create_task(dp.fsm.storage.run_sweeper())
+    await resume_jobs()
+    dp.message.outer_middleware(DbSessionMiddleware())
+    dp.callback_query.outer_middleware(DbSessionMiddleware())
+    dp.message.outer_middleware(ReachabilityMiddleware())
+    dp.callback_query.outer_middleware(ReachabilityMiddleware())
     dp.message.outer_middleware(BanMiddleware())
     dp.callback_query.outer_middleware(BanMiddleware())
 
@@ -37,7 +85,12 @@ async def main():
 
     dp.include_router(router)
 
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        roles_listener.cancel()
+        if fsm_sweeper:
+            fsm_sweeper.cancel()
 
 
 if __name__ == "__main__":
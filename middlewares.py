@@ -1,12 +1,66 @@
 """Посредники."""
 import asyncio
+from collections import Counter
 from typing import Any, Awaitable, Callable, Dict, List
 
 from aiogram import BaseMiddleware
 from aiogram.types import CallbackQuery, Message, TelegramObject
 
-from config import active_dialogs, banned_ids
+from sqlalchemy import event as sa_event
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from config import banned_ids, unreachable_ids
+from dialogs import dialogs
 from keyboards import get_banned_kb
+from models import User, async_session
+
+
+# Счетчики работы с БД из апдейтов (см. DbSessionMiddleware).
+db_stats: Counter = Counter()
+
+
+@sa_event.listens_for(Session, "after_begin")
+def _count_begin(session, transaction, connection):
+    session.info["begins"] = session.info.get("begins", 0) + 1
+
+
+class DbSessionMiddleware(BaseMiddleware):
+    """
+    Одна сессия БД на апдейт в data["session"]. Соединение берется из пула
+    только при первом запросе. После обработчика незакоммиченное
+    коммитится, при ошибке откатывается.
+
+    Обработчик сам завершает транзакцию (session.commit()), как только
+    закончил с БД: иначе соединение висит «idle in transaction» на все
+    время запросов к Telegram.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+
+        async with async_session() as session:
+            data["session"] = session
+            try:
+                result = await handler(event, data)
+                if session.in_transaction():
+                    await session.commit()
+            except Exception:
+                db_stats["rollbacks"] += 1
+                await session.rollback()
+                raise
+            finally:
+                begins = session.info.get("begins", 0)
+                db_stats["updates"] += 1
+                db_stats["transactions"] += begins
+                if begins:
+                    db_stats["updates_with_db"] += 1
+
+        return result
 
 
 BLOCKED_BUTTONS = [
@@ -36,7 +90,7 @@ class BanMiddleware(BaseMiddleware):
 
         if user.id in banned_ids:
 
-            if user.id in active_dialogs:
+            if await dialogs.admin_of(user.id):
 
                 if isinstance(event, CallbackQuery):
                     await event.answer(
@@ -72,6 +126,35 @@ class BanMiddleware(BaseMiddleware):
         return await handler(event, data)
 
 
+class ReachabilityMiddleware(BaseMiddleware):
+    """Снимает пометку «недоступен», когда участник снова пишет боту."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+
+        user = data.get("event_from_user")
+        if user and user.id in unreachable_ids:
+            unreachable_ids.discard(user.id)
+            session = data["session"]
+            try:
+                await session.execute(
+                    update(User)
+                    .where(User.telegram_id == user.id)
+                    .values(is_unreachable=False)
+                )
+                await session.commit()
+            except Exception as e:
+                await session.rollback()
+                unreachable_ids.add(user.id)
+                print(f"Не удалось снять пометку недоступности: {e}")
+
+        return await handler(event, data)
+
+
 class MediaGroupMiddleware(BaseMiddleware):
     """Собирает медиа в альбом для отправки группой."""
 
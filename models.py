@@ -1,9 +1,45 @@
 """Модели для базы данных"""
-from sqlalchemy import BigInteger, Boolean, Column, Integer, String, Text
+import hashlib
+import time
+import uuid
+from typing import NamedTuple
+
+from sqlalchemy import (
+    JSON,
+    BigInteger,
+    Boolean,
+    Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    Text,
+    false,
+    cast,
+    func,
+    literal,
+    or_,
+    select,
+    text,
+)
+from sqlalchemy.dialects.postgresql import REGCLASS
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
-from config import DATABASE_URL
+from config import (
+    DATABASE_URL,
+    DB_MAX_OVERFLOW,
+    DB_PGBOUNCER,
+    DB_POOL_PRE_PING,
+    DB_POOL_RECYCLE,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    DB_STATEMENT_CACHE_SIZE,
+)
 
 Base = declarative_base()
 
@@ -30,6 +66,79 @@ class User(Base):
     is_banned = Column(Boolean, default=False)
     is_admin = Column(Boolean, default=False)
 
+    # md5 от «логин:пароль», которые участник уже получил (см. creds_fingerprint).
+    creds_sent_hash = Column(String, nullable=True)
+
+    # Бот заблокирован или аккаунт удален: в рассылках не участвует.
+    is_unreachable = Column(
+        Boolean, nullable=False, default=False, server_default=false()
+    )
+
+    __table_args__ = (
+        Index(
+            "ix_users_bot_reachable_id",
+            "id",
+            postgresql_where=text("NOT is_unreachable"),
+        ),
+        Index("ix_users_bot_grade_id", "grade", "id"),
+        # Кэши банов и админов при старте: строк мало, индекс частичный.
+        Index(
+            "ix_users_bot_banned",
+            "telegram_id",
+            postgresql_where=text("is_banned IS TRUE"),
+        ),
+        Index(
+            "ix_users_bot_admin",
+            "telegram_id",
+            postgresql_where=text("is_admin IS TRUE"),
+        ),
+    )
+
+
+class UserSnapshot(NamedTuple):
+    """
+    Поля участника для многошаговых сценариев. Хранится в данных FSM
+    списком значений: UserSnapshot(*data[...]) восстанавливает его.
+    """
+
+    id: int
+    telegram_id: int
+    username: str
+    full_name: str
+
+
+USER_SNAPSHOT_COLUMNS = (User.id, User.telegram_id, User.username, User.full_name)
+
+
+# Сегменты рассылок: поиск без учета регистра + курсор по id.
+Index("ix_users_bot_place_id", func.lower(User.place_of_study), User.id)
+Index("ix_users_bot_school_id", func.lower(User.school), User.id)
+
+# Поиск по username (в Telegram он без учета регистра) и порядок выгрузки.
+Index("ix_users_bot_username_lower", func.lower(User.username))
+Index("ix_users_bot_points_name", User.points.desc(), User.full_name, User.id)
+
+
+def username_is(username: str):
+    """Условие поиска по username без учета регистра (по индексу)."""
+
+    return func.lower(User.username) == username.lower()
+
+
+def creds_fingerprint(login_id: str, plain_password: str) -> str:
+    """Отпечаток кредов; в SQL то же считает md5(login_id || ':' || plain_password)."""
+
+    return hashlib.md5(f"{login_id}:{plain_password}".encode()).hexdigest()
+
+
+def creds_not_delivered():
+    """Условие: участник еще не получал кредов или они с тех пор изменились."""
+
+    return or_(
+        User.creds_sent_hash.is_(None),
+        User.creds_sent_hash != func.md5(User.login_id + ":" + User.plain_password),
+    )
+
 
 class BannedUser(Base):
     """Таблица забаненных участников."""
@@ -48,7 +157,130 @@ class BannedUser(Base):
     admin_who_unbanned = Column(String, nullable=True)
 
 
-engine = create_async_engine(DATABASE_URL, echo=False)
+class BroadcastJob(Base):
+    """Задание на рассылку с курсором по users_bot.id."""
+
+    __tablename__ = "broadcast_jobs"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    admin_id = Column(BigInteger, nullable=False)
+
+    from_chat_id = Column(BigInteger, nullable=False)
+    message_id = Column(Integer, nullable=False)
+    album = Column(JSON, nullable=True)
+
+    # Сегмент аудитории (см. segment_where); None — все участники.
+    segment_field = Column(String, nullable=True)
+    segment_value = Column(String, nullable=True)
+
+    # running / paused / cancelled / done
+    status = Column(String, nullable=False, default="running")
+    cursor = Column(Integer, nullable=False, default=0)
+    total = Column(Integer, nullable=False, default=0, server_default="0")
+    progress_message_id = Column(Integer, nullable=True)
+    sent_count = Column(Integer, nullable=False, default=0)
+    failed_count = Column(Integer, nullable=False, default=0)
+
+    created_at = Column(DateTime, server_default=func.now())
+    finished_at = Column(DateTime, nullable=True)
+
+
+class BroadcastDelivery(Base):
+    """Статус доставки рассылки конкретному участнику."""
+
+    __tablename__ = "broadcast_deliveries"
+
+    job_id = Column(
+        Integer, ForeignKey("broadcast_jobs.id", ondelete="CASCADE"), primary_key=True
+    )
+    user_id = Column(Integer, primary_key=True)
+    status = Column(String, nullable=False)
+
+
+class UsersRevision(Base):
+    """Счетчик изменений выгружаемых данных участников (одна строка)."""
+
+    __tablename__ = "users_bot_revision"
+
+    id = Column(Integer, primary_key=True)
+    revision = Column(BigInteger, nullable=False, default=0)
+
+
+class FsmRecord(Base):
+    """Состояние и данные FSM одного чата (см. fsm_storage.PgStorage)."""
+
+    __tablename__ = "fsm_states"
+
+    key = Column(String, primary_key=True)
+    state = Column(String, nullable=True)
+    data = Column(JSON, nullable=False, default=dict, server_default="{}")
+    updated_at = Column(
+        DateTime(timezone=True),
+        nullable=False,
+        server_default=func.now(),
+        onupdate=func.now(),
+    )
+
+    __table_args__ = (Index("ix_fsm_states_updated_at", "updated_at"),)
+
+
+class ActiveDialog(Base):
+    """Открытый диалог организатора с участником (см. dialogs.PgDialogStore)."""
+
+    __tablename__ = "active_dialogs"
+
+    user_id = Column(BigInteger, primary_key=True)
+    admin_id = Column(BigInteger, unique=True, nullable=False)
+    started_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Пул, который считает ожидание свободного соединения."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+
+
+def _connect_args() -> dict:
+    if DB_PGBOUNCER:
+        # PgBouncer (transaction) отдает каждую транзакцию любому серверному
+        # соединению: кэш prepared statements выключен, имена уникальны.
+        return {
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
+        }
+    return {"prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE}
+
+
+engine = create_async_engine(
+    DATABASE_URL,
+    echo=False,
+    poolclass=TimedQueuePool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+    connect_args=_connect_args(),
+)
 async_session = sessionmaker(
     engine,
     expire_on_commit=False,
@@ -56,8 +288,181 @@ async_session = sessionmaker(
     )
 
 
+def pool_stats() -> dict:
+    """Текущее состояние пула соединений."""
+
+    pool = engine.pool
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+        "max_overflow": DB_MAX_OVERFLOW,
+        "checkouts": pool.checkouts,
+        "timeouts": pool.timeouts,
+        "wait_avg_ms": pool.wait_total / pool.checkouts * 1000 if pool.checkouts else 0.0,
+        "wait_max_ms": pool.wait_max * 1000,
+    }
+
+
+def insert_registration(plain_password: str, **fields):
+    """
+    Запрос регистрации одним INSERT: id берется из последовательности,
+    логин 'user<id>' и отпечаток кредов считаются в БД. RETURNING (id,
+    login_id) пуст, если участник с таким telegram_id уже есть.
+    """
+
+    new_id = select(
+        func.nextval(cast(func.pg_get_serial_sequence("users_bot", "id"), REGCLASS))
+        .label("id")
+    ).cte("new_id")
+    login = literal("user") + cast(new_id.c.id, String)
+
+    values = {
+        "id": new_id.c.id,
+        **{name: literal(value, User.__table__.c[name].type) for name, value in fields.items()},
+        "login_id": login,
+        "plain_password": literal(plain_password, String),
+        "creds_sent_hash": func.md5(login + literal(":") + literal(plain_password, String)),
+    }
+    return (
+        pg_insert(User)
+        .from_select(list(values), select(*values.values()))
+        .on_conflict_do_nothing(index_elements=["telegram_id"])
+        .returning(User.id, User.login_id)
+    )
+
+
+def segment_where(field: str = None, value: str = None) -> tuple:
+    """Условия отбора участников для сегмента рассылки."""
+
+    if field == "grade":
+        return (User.grade == value,)
+    if field == "place":
+        return (func.lower(User.place_of_study) == func.lower(value),)
+    if field == "school":
+        return (func.lower(User.school) == func.lower(value),)
+    return ()
+
+
+async def iter_user_batches(*columns, after_id: int = 0, batch_size: int = 500, where=()):
+    """
+    Постранично (по User.id) отдает строки участников только с нужными
+    столбцами. Каждая пачка читается отдельным коротким запросом, поэтому
+    соединение не держится занятым, пока идет отправка.
+    """
+
+    while True:
+        async with async_session() as session:
+            result = await session.execute(
+                select(User.id, *columns)
+                .where(User.id > after_id, *where)
+                .order_by(User.id)
+                .limit(batch_size)
+            )
+            rows = result.all()
+
+        if not rows:
+            return
+        yield rows
+        after_id = rows[-1].id
+
+
+async def users_version() -> int:
+    """
+    Версия данных участников: ревизия из users_bot_revision. Растет при
+    регистрации, удалении и изменении выгружаемых полей, в порядке коммитов.
+    """
+
+    async with async_session() as session:
+        return await session.scalar(select(UsersRevision.revision))
+
+
+async def iter_users(*columns, batch_size: int = 500, where=()):
+    """То же, что iter_user_batches, но по одной строке."""
+
+    async for rows in iter_user_batches(*columns, batch_size=batch_size, where=where):
+        for row in rows:
+            yield row
+
+
+# Канал NOTIFY об изменениях банов и админов (см. role_cache).
+ROLES_CHANNEL = "users_bot_roles"
+
+# create_all не меняет уже существующие таблицы: новые столбцы
+# добавляются здесь, а недостающие индексы создаются по метаданным.
+SCHEMA_PATCHES = [
+    "ALTER TABLE users_bot ADD COLUMN IF NOT EXISTS "
+    "is_unreachable BOOLEAN NOT NULL DEFAULT false",
+    "ALTER TABLE users_bot ADD COLUMN IF NOT EXISTS creds_sent_hash VARCHAR",
+]
+
+# Счетчик ревизий и триггеры users_bot: их ставит и init_db, и бенчмарк
+# регистрации в своей схеме.
+USERS_BOT_TRIGGERS = [
+    "INSERT INTO users_bot_revision (id, revision) VALUES (1, 0) "
+    "ON CONFLICT DO NOTHING",
+    # Один раз на оператор, а не на строку. Служебные флаги
+    # (is_unreachable, creds_sent_hash) версию не меняют. Строка счетчика
+    # заблокирована до конца транзакции: все пишущие в users_bot идут через
+    # нее по очереди, зато ревизии растут в порядке коммитов.
+    """
+    CREATE OR REPLACE FUNCTION users_bot_touch() RETURNS trigger AS $$
+    BEGIN
+        UPDATE users_bot_revision SET revision = revision + 1 WHERE id = 1;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS users_bot_touch ON users_bot",
+    "CREATE TRIGGER users_bot_touch AFTER INSERT OR DELETE OR UPDATE OF "
+    "telegram_id, username, full_name, phone, place_of_study, school, grade, "
+    "email, points, login_id, plain_password, is_banned ON users_bot "
+    "FOR EACH STATEMENT EXECUTE FUNCTION users_bot_touch()",
+    f"""
+    CREATE OR REPLACE FUNCTION users_bot_notify_roles() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            PERFORM pg_notify('{ROLES_CHANNEL}', json_build_object(
+                'telegram_id', OLD.telegram_id,
+                'is_banned', false,
+                'is_admin', false
+            )::text);
+            RETURN OLD;
+        END IF;
+        IF (TG_OP = 'INSERT' AND (NEW.is_banned OR NEW.is_admin))
+           OR (TG_OP = 'UPDATE' AND (
+               NEW.is_banned IS DISTINCT FROM OLD.is_banned
+               OR NEW.is_admin IS DISTINCT FROM OLD.is_admin))
+        THEN
+            PERFORM pg_notify('{ROLES_CHANNEL}', json_build_object(
+                'telegram_id', NEW.telegram_id,
+                'is_banned', coalesce(NEW.is_banned, false),
+                'is_admin', coalesce(NEW.is_admin, false)
+            )::text);
+        END IF;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS users_bot_notify_roles ON users_bot",
+    "CREATE TRIGGER users_bot_notify_roles "
+    "AFTER INSERT OR DELETE OR UPDATE OF is_banned, is_admin ON users_bot "
+    "FOR EACH ROW EXECUTE FUNCTION users_bot_notify_roles()",
+]
+
+
+def _create_missing_indexes(conn):
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+
 async def init_db():
     """Инициализируем БД."""
 
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        for patch in SCHEMA_PATCHES + USERS_BOT_TRIGGERS:
+            await conn.execute(text(patch))
+        await conn.run_sync(_create_missing_indexes)
@@ -0,0 +1,87 @@
+"""Кэш профилей участников для частых кнопок меню."""
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+from sqlalchemy import select
+
+from config import PROFILE_CACHE_NEGATIVE_TTL, PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL
+from models import User, async_session
+
+
+class Profile(NamedTuple):
+    """Поля участника, которые нужны меню."""
+
+    login_id: str
+    plain_password: str
+
+
+class ProfileCache:
+    """
+    LRU с TTL: telegram_id -> Profile или None (не зарегистрирован).
+    Отрицательные ответы живут меньше: регистрация их сбрасывает явно,
+    но в другом процессе этого сброса не будет.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, negative_ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._items: OrderedDict[int, tuple[float, Profile]] = OrderedDict()
+        self.generation = 0
+
+    def get(self, telegram_id: int) -> tuple[bool, Profile]:
+        """(найдено, профиль). Просроченная запись удаляется."""
+
+        item = self._items.get(telegram_id)
+        if item is None:
+            return False, None
+        expires, profile = item
+        if expires < time.monotonic():
+            del self._items[telegram_id]
+            return False, None
+        self._items.move_to_end(telegram_id)
+        return True, profile
+
+    def put(self, telegram_id: int, profile: Profile):
+        ttl = self.ttl if profile is not None else self.negative_ttl
+        self._items[telegram_id] = (time.monotonic() + ttl, profile)
+        self._items.move_to_end(telegram_id)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def invalidate(self, telegram_id: int):
+        self.generation += 1
+        self._items.pop(telegram_id, None)
+
+
+profiles = ProfileCache(PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL, PROFILE_CACHE_NEGATIVE_TTL)
+
+
+async def get_profile(telegram_id: int) -> Profile:
+    """Профиль участника из кэша или БД; None — не зарегистрирован."""
+
+    found, profile = profiles.get(telegram_id)
+    if found:
+        return profile
+
+    # Если за время запроса профиль сбросили, прочитанное могло устареть.
+    generation = profiles.generation
+    async with async_session() as session:
+        result = await session.execute(
+            select(User.login_id, User.plain_password).where(
+                User.telegram_id == telegram_id
+            )
+        )
+        row = result.one_or_none()
+
+    profile = Profile(*row) if row else None
+    if profiles.generation == generation:
+        profiles.put(telegram_id, profile)
+    return profile
+
+
+def invalidate_profile(telegram_id: int):
+    """Сбрасывает профиль после регистрации."""
+
+    profiles.invalidate(telegram_id)
@@ -0,0 +1,106 @@
+"""Кэши банов и админов: снимок из БД и обновления через LISTEN/NOTIFY."""
+import asyncio
+import json
+
+import asyncpg
+from sqlalchemy import or_, select
+
+from config import (
+    ARCHITECT_ID,
+    DATABASE_DIRECT_URL,
+    DATABASE_URL,
+    DB_PGBOUNCER,
+    ENV_ADMIN_IDS,
+    admin_ids_set,
+    banned_ids,
+)
+from models import ROLES_CHANNEL, User, async_session
+
+# Админы из окружения: в БД их может не быть, из кэша не удаляются.
+STATIC_ADMIN_IDS = set(ENV_ADMIN_IDS) | ({ARCHITECT_ID} if ARCHITECT_ID else set())
+
+KEEPALIVE_INTERVAL = 60
+RECONNECT_DELAY = 5
+
+
+async def load_roles():
+    """Снимок банов и админов одним запросом (по частичным индексам)."""
+
+    async with async_session() as session:
+        result = await session.execute(
+            select(User.telegram_id, User.is_banned, User.is_admin).where(
+                or_(User.is_banned.is_(True), User.is_admin.is_(True))
+            )
+        )
+        rows = result.all()
+
+    banned = {row.telegram_id for row in rows if row.is_banned}
+    admins = STATIC_ADMIN_IDS | {row.telegram_id for row in rows if row.is_admin}
+
+    # Множества меняются на месте: их импортируют другие модули. Сначала
+    # убираем лишнее, потом добавляем новое — без момента, когда
+    # множество пустое и настоящим админам отказано.
+    banned_ids.intersection_update(banned)
+    banned_ids.update(banned)
+    admin_ids_set.intersection_update(admins)
+    admin_ids_set.update(admins)
+
+
+def apply_role_change(payload: str):
+    """Применяет уведомление триггера users_bot_notify_roles."""
+
+    change = json.loads(payload)
+    telegram_id = change["telegram_id"]
+
+    if change["is_banned"]:
+        banned_ids.add(telegram_id)
+    else:
+        banned_ids.discard(telegram_id)
+
+    if change["is_admin"]:
+        admin_ids_set.add(telegram_id)
+    elif telegram_id not in STATIC_ADMIN_IDS:
+        admin_ids_set.discard(telegram_id)
+
+
+async def listen_roles():
+    """
+    Держит отдельное соединение с LISTEN на ROLES_CHANNEL. После каждого
+    подключения перечитывает снимок: уведомления за время разрыва теряются.
+    Через PgBouncer в режиме transaction LISTEN не работает, нужен
+    DATABASE_DIRECT_URL.
+    """
+
+    if DB_PGBOUNCER and not DATABASE_DIRECT_URL:
+        print(
+            "PgBouncer без DATABASE_DIRECT_URL: кэш ролей обновляется только при старте."
+        )
+        return
+
+    dsn = (DATABASE_DIRECT_URL or DATABASE_URL).replace("+asyncpg", "")
+    while True:
+        conn = None
+        try:
+            conn = await asyncpg.connect(dsn)
+            closed = asyncio.Event()
+            conn.add_termination_listener(lambda _: closed.set())
+            await conn.add_listener(
+                ROLES_CHANNEL, lambda _conn, _pid, _channel, payload: apply_role_change(payload)
+            )
+            await load_roles()
+
+            while not closed.is_set():
+                try:
+                    await asyncio.wait_for(closed.wait(), KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    await conn.execute("SELECT 1")
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Слушатель ролей отключился: {e}")
+        finally:
+            if conn is not None and not conn.is_closed():
+                await conn.close()
+
+        await asyncio.sleep(RECONNECT_DELAY)
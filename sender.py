@@ -0,0 +1,237 @@
+"""Исходящие сообщения: лимиты Telegram, RetryAfter и повторы."""
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Any, Awaitable, Callable
+
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramEntityTooLarge,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+
+from config import (
+    SEND_BACKOFF,
+    SEND_CONCURRENCY,
+    SEND_MAX_ATTEMPTS,
+    SEND_PER_CHAT_INTERVAL,
+    SEND_RATE,
+)
+
+
+class TokenBucket:
+    """Корзина токенов: rate токенов в секунду, не больше capacity разом."""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: float = 1):
+        """Ждет, пока в корзине наберется нужное число токенов, и забирает их."""
+
+        tokens = min(tokens, self.capacity)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+
+class RateLimiter:
+    """Общий лимит бота и отдельный интервал для каждого чата."""
+
+    PRUNE_THRESHOLD = 10_000
+
+    def __init__(self, rate: float, per_chat_interval: float):
+        self.bucket = TokenBucket(rate)
+        self.per_chat_interval = per_chat_interval
+        self._next_slot: dict[int, float] = {}
+        self._paused_until = 0.0
+
+    def pause(self, seconds: float):
+        """Останавливает все отправки на время flood control."""
+
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self, chat_id: int, cost: int = 1):
+        """Резервирует слот в чате и cost токенов из общей корзины."""
+
+        now = time.monotonic()
+        slot = max(now, self._next_slot.get(chat_id, 0.0))
+        self._next_slot[chat_id] = slot + self.per_chat_interval
+        if len(self._next_slot) > self.PRUNE_THRESHOLD:
+            self._prune(now)
+
+        if slot > now:
+            await asyncio.sleep(slot - now)
+        while (delay := self._paused_until - time.monotonic()) > 0:
+            await asyncio.sleep(delay)
+        await self.bucket.acquire(cost)
+
+    def _prune(self, now: float):
+        """Удаляет чаты, у которых интервал уже истек."""
+
+        self._next_slot = {
+            chat_id: slot for chat_id, slot in self._next_slot.items() if slot > now
+        }
+
+
+class DeliveryFailed(Exception):
+    """Сообщение не доставлено. permanent=True — повторять бессмысленно."""
+
+    def __init__(self, chat_id: int, error: Exception, permanent: bool):
+        super().__init__(f"{chat_id}: {error}")
+        self.chat_id = chat_id
+        self.error = error
+        self.permanent = permanent
+
+    UNREACHABLE_MARKERS = ("chat not found", "user is deactivated", "peer_id_invalid")
+
+    @property
+    def unreachable(self) -> bool:
+        """Бот заблокирован, аккаунт удален или чат не существует."""
+
+        if isinstance(self.error, TelegramForbiddenError):
+            return True
+        if isinstance(self.error, TelegramBadRequest):
+            text = self.error.message.lower()
+            return any(marker in text for marker in self.UNREACHABLE_MARKERS)
+        return False
+
+
+class _Outgoing:
+    __slots__ = ("chat_id", "call", "cost", "future", "attempt")
+
+    def __init__(self, chat_id, call, cost, future):
+        self.chat_id = chat_id
+        self.call = call
+        self.cost = cost
+        self.future = future
+        self.attempt = 0
+
+
+class OutboundScheduler:
+    """
+    Общая очередь исходящих сообщений. Соблюдает лимиты, при RetryAfter
+    ставит все отправки на паузу и откладывает сообщение в очередь
+    повторов, при временных ошибках повторяет с экспоненциальной задержкой.
+    """
+
+    TRANSIENT = (TelegramServerError, TelegramNetworkError, asyncio.TimeoutError)
+
+    def __init__(
+        self,
+        limiter: RateLimiter,
+        concurrency: int,
+        max_attempts: int,
+        backoff: float,
+    ):
+        self.limiter = limiter
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self._ready: asyncio.Queue = None
+        self._delayed: list = []
+        self._wakeup: asyncio.Event = None
+        self._tasks: list[asyncio.Task] = []
+        self._seq = itertools.count()
+
+    async def send(
+        self, chat_id: int, call: Callable[[], Awaitable[Any]], cost: int = 1
+    ) -> Any:
+        """
+        Выполняет call() (новый запрос на каждую попытку) и возвращает
+        результат или бросает DeliveryFailed.
+        """
+
+        self._ensure_started()
+        item = _Outgoing(
+            chat_id, call, cost, asyncio.get_running_loop().create_future()
+        )
+        self._ready.put_nowait(item)
+        return await item.future
+
+    def _ensure_started(self):
+        if self._tasks:
+            return
+        self._ready = asyncio.Queue()
+        self._wakeup = asyncio.Event()
+        self._tasks = [
+            asyncio.create_task(self._worker()) for _ in range(self.concurrency)
+        ]
+        self._tasks.append(asyncio.create_task(self._timer()))
+
+    async def _worker(self):
+        while True:
+            item = await self._ready.get()
+            if item.future.done():
+                continue
+
+            await self.limiter.acquire(item.chat_id, item.cost)
+            try:
+                result = await item.call()
+            except TelegramRetryAfter as e:
+                self.limiter.pause(e.retry_after)
+                self._delay(item, e.retry_after)
+            except TelegramEntityTooLarge as e:
+                self._fail(item, e, permanent=True)
+            except self.TRANSIENT as e:
+                item.attempt += 1
+                if item.attempt >= self.max_attempts:
+                    self._fail(item, e, permanent=False)
+                else:
+                    self._delay(item, self.backoff * 2 ** (item.attempt - 1))
+            except Exception as e:
+                self._fail(item, e, permanent=True)
+            else:
+                if not item.future.done():
+                    item.future.set_result(result)
+
+    def _fail(self, item: _Outgoing, error: Exception, permanent: bool):
+        if not item.future.done():
+            item.future.set_exception(DeliveryFailed(item.chat_id, error, permanent))
+
+    def _delay(self, item: _Outgoing, seconds: float):
+        heapq.heappush(
+            self._delayed, (time.monotonic() + seconds, next(self._seq), item)
+        )
+        self._wakeup.set()
+
+    async def _timer(self):
+        """Возвращает отложенные сообщения в очередь, когда подходит их время."""
+
+        while True:
+            self._wakeup.clear()
+            if not self._delayed:
+                await self._wakeup.wait()
+                continue
+
+            delay = self._delayed[0][0] - time.monotonic()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            _, _, item = heapq.heappop(self._delayed)
+            self._ready.put_nowait(item)
+
+
+limiter = RateLimiter(SEND_RATE, SEND_PER_CHAT_INTERVAL)
+scheduler = OutboundScheduler(
+    limiter, SEND_CONCURRENCY, SEND_MAX_ATTEMPTS, SEND_BACKOFF
+)